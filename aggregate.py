@@ -0,0 +1,90 @@
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from calc import (PRIOR_2024, STAGE3_2025, PROPOSED_2025, NR_2025, PROPOSED_NR_2025, HM_2025,
+                  PROPOSED_HM_2025, MEDICARE_2025, PROPOSED_MEDICARE_2025, LITO, LITMO, RULES)
+from piecewise import from_schedule, from_medicare, from_offset, liability
+
+# Piecewise forms of everything in calc.LIABILITIES, under the same names
+PIECEWISE = {
+    'prior_tax2024': from_schedule(PRIOR_2024),
+    'stage3tax2025': from_schedule(STAGE3_2025),
+    'proposedtax2025': from_schedule(PROPOSED_2025),
+    'nrtax2025': from_schedule(NR_2025),
+    'proposed_nrtax2025': from_schedule(PROPOSED_NR_2025),
+    'hmtax2025': from_schedule(HM_2025),
+    'proposed_hmtax2025': from_schedule(PROPOSED_HM_2025),
+    'medicare2025': from_medicare(MEDICARE_2025),
+    'proposed_medicare2025': from_medicare(PROPOSED_MEDICARE_2025),
+    'lito': from_offset(LITO),
+    'litmo': from_offset(LITMO),
+}
+
+def band_total(function, lower, upper, count, income=None, strict=True):
+    # Total of a piecewise-linear function over income bands of count taxpayers.
+    # A band that sits on one straight piece is exact for any spread of incomes
+    # when the band's total income is known: count * c + m * income.  Other
+    # bands assume incomes spread evenly across them and integrate exactly.
+    # An open-ended band that can't be totalled raises, or gives nan when not strict.
+    lower = np.asarray(lower, dtype=np.float64)
+    upper = np.asarray(upper, dtype=np.float64)
+    count = np.asarray(count, dtype=np.float64)
+    width = upper - lower
+
+    finite = np.where(np.isfinite(upper), upper, lower)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spread = np.where(width > 0, function.integral(lower, finite) / width, function(lower))
+    total = np.where(np.isfinite(upper), count * spread, np.nan)
+
+    if income is not None:
+        income = np.asarray(income, dtype=np.float64)
+        k = np.searchsorted(function.breaks, lower, side='right')
+        straight = k == np.searchsorted(function.breaks, upper, side='left')
+        total = np.where(straight, count * function.c[k] + function.m[k] * income, total)
+
+    unknown = ~np.isfinite(total) & (count > 0)
+    if unknown.any():
+        if not strict:
+            return float('nan')
+        raise ValueError(f"open-ended band from {lower[unknown][0]:,.0f} needs its total income "
+                         "and must sit on one straight piece of the schedule")
+    return float(np.sum(np.where(count > 0, total, 0.0)))
+
+def totals(lower, upper, count, income=None):
+    # Every named liability plus each rules.json entry's combined liability
+    # (tax less offsets, floored at nil, plus Medicare) over the bands.  One
+    # open-ended band crossing a break of some schedule (say "180,001 or more"
+    # against a break at 190,000) leaves just those schedules nan.
+    result = {name: band_total(function, lower, upper, count, income, strict=False)
+              for name, function in PIECEWISE.items()}
+    for key, rule in RULES.schedules.items():
+        result['/'.join(key)] = band_total(liability(rule), lower, upper, count, income, strict=False)
+    return result
+
+def main(argv=None):
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description='Total liability per schedule from an income histogram '
+                                                 '(e.g. ATO taxation statistics bands).')
+    parser.add_argument('input', help='CSV with one row per income band')
+    parser.add_argument('--lower', default='lower', help='band lower bound column (default: lower)')
+    parser.add_argument('--upper', default='upper', help='band upper bound column, blank for open-ended (default: upper)')
+    parser.add_argument('--count', default='count', help='taxpayers in the band column (default: count)')
+    parser.add_argument('--income', help='total taxable income in the band column, optional')
+    args = parser.parse_args(argv)
+
+    bands = pd.read_csv(args.input)
+    upper = bands[args.upper].fillna(np.inf)
+    income = bands[args.income] if args.income else None
+    result = totals(bands[args.lower], upper, bands[args.count], income)
+    skipped = [name for name, total in result.items() if np.isnan(total)]
+    if skipped:
+        print(f"no exact total for {', '.join(skipped)}: an open-ended band crosses a break in "
+              f"{'them' if len(skipped) > 1 else 'it'}", file=sys.stderr)
+    print(json.dumps({name: None if np.isnan(total) else total for name, total in result.items()}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import json
+
+import numpy as np
+
+from calc import LIABILITIES, NET_LIABILITIES, COMPARISONS
+
+# A small ASGI app serving the calculator as JSON.  No framework is needed;
+# any ASGI server runs it, e.g. uvicorn api:app.
+#
+#   POST /calculate  {"taxable_income": 85000, "residency": "resident"}
+#   POST /calculate  {"taxable_income": [45000, 85000], "residency": ["resident", "non_resident"]}
+#   GET  /health
+#
+# Amounts are whole dollars, truncated as the Streamlit app shows them.
+# current and proposed are the tax payable after offsets with Medicare, as in
+# the app, and difference is current less proposed, so positive is better off.
+
+OFFSETS = ('lito', 'litmo')
+RESIDENCIES = tuple(COMPARISONS)
+
+# Requests arriving within WINDOW seconds of each other are evaluated together
+# as one array; a batch reaching MAX_ROWS incomes is evaluated straight away
+WINDOW = 0.002
+MAX_ROWS = 100_000
+
+# Largest income accepted either side of nil, well inside the int64 whole
+# dollars every amount is returned as
+MAX_INCOME = 1e12
+
+def calculate(taxable_income, residency):
+    # One result dict per income, with residency an array of names alongside it
+    taxable_income = np.asarray(taxable_income, dtype=np.float64)
+    liabilities = {name: np.trunc(function(taxable_income)).astype(np.int64) for name, function in LIABILITIES.items()}
+    current = np.zeros(len(taxable_income), dtype=np.int64)
+    proposed = np.zeros(len(taxable_income), dtype=np.int64)
+    for comparison in COMPARISONS:
+        rows = residency == comparison
+        if rows.any():
+            current[rows] = NET_LIABILITIES[f"{comparison}_current"](taxable_income[rows])
+            proposed[rows] = NET_LIABILITIES[f"{comparison}_proposed"](taxable_income[rows])
+
+    columns = {name: values.tolist() for name, values in liabilities.items()}
+    current, proposed = current.tolist(), proposed.tolist()
+    return [{
+        'taxable_income': income,
+        'residency': kind,
+        'liabilities': {name: columns[name][i] for name in LIABILITIES if name not in OFFSETS},
+        'offsets': {name: columns[name][i] for name in OFFSETS},
+        'current': current[i],
+        'proposed': proposed[i],
+        'difference': current[i] - proposed[i],
+    } for i, (income, kind) in enumerate(zip(taxable_income.tolist(), residency.tolist()))]
+
+class Batcher:
+    # Coalesces concurrent calculate requests into one vectorized evaluation
+    def __init__(self, window=WINDOW, max_rows=MAX_ROWS):
+        self.window = window
+        self.max_rows = max_rows
+        self.pending = []
+        self.rows = 0
+        self.timer = None
+        self.batches = 0
+
+    async def submit(self, taxable_income, residency):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((taxable_income, residency, future))
+        self.rows += len(taxable_income)
+        if self.rows >= self.max_rows:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        pending, self.pending, self.rows = self.pending, [], 0
+        if not pending:
+            return
+        self.batches += 1
+        try:
+            results = calculate(np.concatenate([p[0] for p in pending]), np.concatenate([p[1] for p in pending]))
+        except Exception as error:
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        start = 0
+        for taxable_income, _, future in pending:
+            if not future.done():
+                future.set_result(results[start:start + len(taxable_income)])
+            start += len(taxable_income)
+
+def parse(body):
+    # Request body to (incomes, residencies, single), raising ValueError on bad input
+    try:
+        request = json.loads(body or b'{}')
+    except ValueError:
+        raise ValueError('body must be JSON') from None
+    if not isinstance(request, dict) or 'taxable_income' not in request:
+        raise ValueError('expected an object with taxable_income')
+
+    incomes = request['taxable_income']
+    single = not isinstance(incomes, list)
+    incomes = [incomes] if single else incomes
+    if not all(isinstance(x, (int, float)) and not isinstance(x, bool) for x in incomes):
+        raise ValueError('taxable_income must be a number or a list of numbers')
+    # json.loads takes NaN and Infinity, and ints of any size
+    if not all(abs(x) <= MAX_INCOME for x in incomes):
+        raise ValueError(f"taxable_income must be finite and at most {MAX_INCOME:,.0f} either side of nil")
+
+    residency = request.get('residency', 'resident')
+    residency = [residency] * len(incomes) if isinstance(residency, str) else residency
+    if not isinstance(residency, list) or len(residency) != len(incomes) or \
+            not all(isinstance(kind, str) for kind in residency):
+        raise ValueError('residency must be a name or a list of names as long as taxable_income')
+    unknown = set(residency) - set(RESIDENCIES)
+    if unknown:
+        raise ValueError(f"unknown residency {sorted(unknown)[0]!r}, expected one of {', '.join(RESIDENCIES)}")
+    return np.array(incomes, dtype=np.float64), np.array(residency, dtype=object), single
+
+class App:
+    def __init__(self, window=WINDOW, max_rows=MAX_ROWS):
+        self.batcher = Batcher(window, max_rows)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while (await receive())['type'] != 'lifespan.shutdown':
+                await send({'type': 'lifespan.startup.complete'})
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+        method, path = scope['method'], scope['path']
+        if path == '/health':
+            status, payload = 200, {'status': 'ok', 'batches': self.batcher.batches}
+        elif path != '/calculate':
+            status, payload = 404, {'error': f"no route {path}"}
+        elif method != 'POST':
+            status, payload = 405, {'error': 'use POST'}
+        else:
+            body = b''
+            while True:
+                message = await receive()
+                body += message.get('body', b'')
+                if not message.get('more_body'):
+                    break
+            try:
+                incomes, residency, single = parse(body)
+            except ValueError as error:
+                status, payload = 400, {'error': str(error)}
+            else:
+                results = await self.batcher.submit(incomes, residency) if len(incomes) else []
+                status, payload = 200, results[0] if single else {'results': results}
+
+        data = json.dumps(payload).encode()
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(data)).encode())]})
+        await send({'type': 'http.response.body', 'body': data})
+
+app = App()
+
+class Client:
+    # Calls an ASGI app in process, without a server or sockets.  Requests
+    # made concurrently (e.g. under asyncio.gather) are batched like real ones.
+    def __init__(self, app=app):
+        self.app = app
+
+    async def request(self, method, path, payload=None):
+        body = b'' if payload is None else json.dumps(payload).encode()
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+                 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'headers': []}
+        sent = False
+        response = {}
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                return {'type': 'http.disconnect'}
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+            else:
+                response['body'] = response.get('body', b'') + message.get('body', b'')
+
+        await self.app(scope, receive, send)
+        return response['status'], json.loads(response['body'])
+
+    async def calculate(self, taxable_income, residency='resident'):
+        return await self.request('POST', '/calculate', {'taxable_income': taxable_income, 'residency': residency})
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the calculator as a JSON API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--window', type=float, default=WINDOW * 1000, help='batching window in ms (default: %(default)s)')
+    parser.add_argument('--max-rows', type=int, default=MAX_ROWS, help='rows that end a batch early (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    try:
+        import uvicorn
+    except ImportError:
+        parser.exit(1, 'api.py needs an ASGI server to listen on a port: pip install uvicorn\n')
+    uvicorn.run(App(args.window / 1000, args.max_rows), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
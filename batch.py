@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+import store
+from calc import COLUMNS, COMPARISONS
+
+CHUNKSIZE = 1_000_000
+SHARD_SIZE = 1_000_000
+
+def score(taxable_income, exact=False):
+    # All liability columns for one array of incomes, ending with the tax
+    # payable on each side of every comparison
+    taxable_income = pd.to_numeric(pd.Series(taxable_income), errors='coerce').to_numpy('float64')
+    if exact:
+        return score_exact(taxable_income)
+    return pd.DataFrame({name: liability(taxable_income) for name, liability in COLUMNS.items()})
+
+def score_exact(taxable_income):
+    # The same columns from the integer cents engine in exact.py, given back
+    # as dollars.  Each is a whole number of cents, which summarise() recovers
+    # exactly, so totals are those of the integer engine.
+    import exact
+
+    # Incomes beyond exact.MAX_CENTS (data entry errors, in practice) are
+    # left out like unreadable ones, rather than ending the run
+    with np.errstate(invalid='ignore'):
+        valid = np.abs(taxable_income) * 100 <= exact.MAX_CENTS
+    cents = exact.to_cents(np.where(valid, taxable_income, 0.0))
+    columns = {}
+    for name, liability in exact.EXACT_COLUMNS.items():
+        dollars = liability(cents) / 100
+        dollars[~valid] = np.nan
+        columns[name] = dollars
+    return pd.DataFrame(columns)
+
+def summarise(scored):
+    # Totals are kept in whole cents per row, integer sums don't depend on the
+    # order rows are added so the merged result is the same for any sharding.
+    # Rows without a usable income count as zero.
+    cents = {name: np.rint(np.nan_to_num(scored[name].to_numpy()) * 100).astype(np.int64) for name in COLUMNS}
+    summary = {'rows': len(scored)}
+    summary['total_cents'] = {name: int(cents[name].sum()) for name in COLUMNS}
+    for comparison in COMPARISONS:
+        difference = cents[f"{comparison}_current"] - cents[f"{comparison}_proposed"]
+        summary[comparison] = {
+            'better_off': int((difference > 0).sum()),
+            'worse_off': int((difference < 0).sum()),
+            'unchanged': int((difference == 0).sum()),
+        }
+    return summary
+
+def merge(total, summary):
+    # Add one summary into another, both shaped like summarise() output
+    if total is None:
+        return summary
+    merged = {}
+    for key, value in total.items():
+        if isinstance(value, dict):
+            merged[key] = {k: v + summary[key][k] for k, v in value.items()}
+        else:
+            merged[key] = value + summary[key]
+    return merged
+
+def file_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'parquet' if str(path).lower().endswith(('.parquet', '.pq')) else 'csv'
+
+def read_chunks(path, columns, chunksize=CHUNKSIZE, fmt=None, text=()):
+    # Stream the input so only one chunk of rows is ever held in memory.  CSV
+    # columns in text are read as strings: pandas infers types chunk by chunk,
+    # and an id column that is whole numbers in one chunk and has a blank in
+    # the next would change the output schema part way through.
+    if file_format(path, fmt) == 'parquet':
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize, dtype={name: str for name in text})
+
+class ChunkWriter:
+    # Appends scored chunks to a single Parquet or CSV file
+    def __init__(self, path, fmt=None):
+        self.path = path
+        self.format = file_format(path, fmt)
+        self.writer = None
+
+    def write(self, df):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            if self.format == 'parquet':
+                # Liabilities are near-unique floats, dictionary pages only cost time
+                self.writer = pq.ParquetWriter(self.path, table.schema, use_dictionary=False)
+            else:
+                self.writer = pacsv.CSVWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def run(input_path, output_path, column='taxable_income', keep=(), chunksize=CHUNKSIZE,
+        input_format=None, output_format=None, building=None, exact=False):
+    # building is a store.begin() directory to also write the store's part to
+    keep = [c for c in keep if c != column]
+    total = None
+    start = time.perf_counter()
+    part = os.path.join(building, 'part-00000.arrow') if building else None
+    with ChunkWriter(output_path, output_format) as writer, store.PartWriter(part, column) as stored:
+        for chunk in read_chunks(input_path, keep + [column], chunksize, input_format, keep):
+            scored = score_chunk(chunk, column, keep, exact)
+            total = merge(total, summarise(scored))
+            if output_path:
+                writer.write(scored)
+            if building:
+                stored.write(scored)
+    return total, time.perf_counter() - start
+
+def score_chunk(chunk, column, keep=(), exact=False):
+    # The income is written as scored, float64 with nan where it couldn't be
+    # read, so every chunk has the same schema whatever pandas made of it
+    taxable_income = pd.to_numeric(chunk[column], errors='coerce').to_numpy('float64')
+    scored = score(taxable_income, exact)
+    scored.insert(0, column, taxable_income)
+    for i, name in enumerate(keep):
+        scored.insert(i, name, chunk[name].to_numpy())
+    return scored
+
+# Each worker process maps the shared Arrow file once and keeps it here
+_shared = {}
+
+def _open_shared(path):
+    _shared['table'] = pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+def _score_shard(shard, start, stop, column, keep, output_dir, output_format, building=None, exact=False):
+    chunk = _shared['table'].slice(start, stop - start).to_pandas()
+    scored = score_chunk(chunk, column, keep, exact)
+    if output_dir:
+        fmt = output_format or 'parquet'
+        with ChunkWriter(os.path.join(output_dir, f"part-{shard:05d}.{fmt}"), fmt) as writer:
+            writer.write(scored)
+    if building:
+        with store.PartWriter(os.path.join(building, f"part-{shard:05d}.arrow"), column) as stored:
+            stored.write(scored)
+    return summarise(scored)
+
+def share(input_path, shared_path, columns, column, chunksize=CHUNKSIZE, fmt=None):
+    # Copy the needed input columns into an uncompressed Arrow IPC file once,
+    # workers then memory-map it and slice their rows out without a copy
+    rows = 0
+    writer = None
+    for chunk in read_chunks(input_path, columns, chunksize, fmt, [c for c in columns if c != column]):
+        chunk[column] = pd.to_numeric(chunk[column], errors='coerce').astype('float64')
+        batch = pa.RecordBatch.from_pandas(chunk[columns], preserve_index=False)
+        if writer is None:
+            writer = pa.ipc.new_file(shared_path, batch.schema)
+        writer.write_batch(batch)
+        rows += batch.num_rows
+    if writer is not None:
+        writer.close()
+    return rows
+
+def run_sharded(input_path, output_dir=None, column='taxable_income', keep=(), shard_size=SHARD_SIZE,
+                workers=None, input_format=None, output_format=None, building=None, exact=False):
+    keep = [c for c in keep if c != column]
+    total = None
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        shared_path = os.path.join(tmp, 'input.arrow')
+        rows = share(input_path, shared_path, keep + [column], column, shard_size, input_format)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        shards = [(i, lo, min(lo + shard_size, rows)) for i, lo in enumerate(range(0, rows, shard_size))]
+        with ProcessPoolExecutor(workers, initializer=_open_shared, initargs=(shared_path,)) as pool:
+            futures = [pool.submit(_score_shard, i, lo, hi, column, keep, output_dir, output_format, building, exact)
+                       for i, lo, hi in shards]
+            for future in futures:
+                total = merge(total, future.result())
+    return total, time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score a file of taxable incomes under every schedule in calc.py.')
+    parser.add_argument('input', help='CSV or Parquet file of taxable incomes')
+    parser.add_argument('output', nargs='?', help='CSV or Parquet file to write, picked by extension; '
+                        'a directory of part files with --workers. Leave out to only print totals')
+    parser.add_argument('--column', default='taxable_income', help='income column in the input (default: taxable_income)')
+    parser.add_argument('--keep', default='', help='comma separated input columns to copy into the output, e.g. an id')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help='rows per chunk (default: %(default)s)')
+    parser.add_argument('--input-format', choices=['csv', 'parquet'])
+    parser.add_argument('--output-format', choices=['csv', 'parquet'])
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes, 0 for one per CPU (default: %(default)s, no pool)')
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE, help='rows per worker shard (default: %(default)s)')
+    parser.add_argument('--exact', action='store_true',
+                        help='score in integer cents (exact.py), totals exact and the same for any sharding')
+    parser.add_argument('--store', action='store_true',
+                        help='keep the scores in the result store, and only print totals from it if already there')
+    parser.add_argument('--store-dir', default=store.STORE_DIR, help='result store directory (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    building = None
+    if args.store:
+        start = time.perf_counter()
+        digest = store.input_hash(args.input, args.column, args.exact)
+        found = store.load(digest, args.store_dir)
+        if found is not None and not args.output:
+            table, meta = found
+            print(json.dumps(meta['summary'], indent=2))
+            print(f"{table.num_rows:,} rows from the store in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+            return
+        if found is None:
+            building = store.begin(args.store_dir)
+
+    keep = [c for c in args.keep.split(',') if c]
+    try:
+        if args.workers == 1:
+            total, seconds = run(args.input, args.output, args.column, keep, args.chunksize,
+                                 args.input_format, args.output_format, building, args.exact)
+        else:
+            total, seconds = run_sharded(args.input, args.output, args.column, keep, args.shard_size,
+                                         args.workers or None, args.input_format, args.output_format, building,
+                                         args.exact)
+    except BaseException:
+        if building:
+            shutil.rmtree(building, ignore_errors=True)
+        raise
+    if building:
+        store.commit(building, digest, args.input, args.column, total, args.store_dir)
+    rows = total['rows'] if total else 0
+    rate = rows / seconds if seconds else float('inf')
+    print(json.dumps(total, indent=2))
+    print(f"{rows:,} rows in {seconds:.2f}s ({rate:,.0f} rows/s)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
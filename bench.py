@@ -0,0 +1,421 @@
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Modules the computation core must not pull in at import time
+HEAVY = ('numpy', 'pandas', 'pyarrow', 'scipy', 'matplotlib', 'streamlit')
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'heavy': sorted(m for m in {heavy!r} if m in sys.modules)}}))
+"""
+
+def import_time(module, repeat=5):
+    # Import module in a fresh interpreter each time, so nothing is already cached
+    runs = []
+    for _ in range(repeat):
+        probe = _IMPORT_PROBE.format(module=module, heavy=HEAVY)
+        out = subprocess.run([sys.executable, '-c', probe], cwd=HERE, check=True,
+                             capture_output=True, text=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    seconds = sorted(run['seconds'] for run in runs)
+    return {
+        'module': module,
+        'median_ms': statistics.median(seconds) * 1000,
+        'min_ms': seconds[0] * 1000,
+        'heavy': runs[-1]['heavy'],
+    }
+
+def bench_imports(modules=('calc', 'piecewise', 'charts', 'lookup', 'batch'), repeat=5):
+    return [import_time(module, repeat) for module in modules]
+
+# Timing suites.  Each returns a list of cases with latency percentiles in
+# microseconds and a throughput (calls or rows per second); the runner adds
+# the suite process's peak RSS.
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == 'darwin' else rss / 1024
+
+def timed(name, call, repeat, rows=1):
+    call()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        call()
+        samples.append(time.perf_counter_ns() - start)
+    samples.sort()
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] / 1000
+    return {
+        'name': name,
+        'p50_us': pick(0.50),
+        'p90_us': pick(0.90),
+        'p99_us': pick(0.99),
+        'throughput': rows * 1e9 / statistics.mean(samples),
+    }
+
+def suite_scalar(args):
+    import calc
+    results = []
+    for name, function in calc.LIABILITIES.items():
+        results.append(timed(f"scalar/{name}", lambda: function(85000.0), args.calls))
+    return results
+
+def suite_batch(args):
+    import numpy as np
+    import calc
+
+    results = []
+    rng = np.random.default_rng(0)
+    for power in range(3, args.max_power + 1):
+        size = 10 ** power
+        incomes = rng.lognormal(11, 0.7, size)
+        repeat = max(3, min(200, 10 ** 7 // size))
+        for name, function in calc.LIABILITIES.items():
+            results.append(timed(f"batch/{name}/1e{power}", lambda: function(incomes), repeat, rows=size))
+        del incomes
+    return results
+
+def suite_exact(args):
+    # The float and integer cents engines on the same whole dollar incomes,
+    # the cents converted up front as a caller holding cents would have them
+    import numpy as np
+    import calc
+    import exact
+
+    size = 10 ** args.max_power
+    incomes = np.round(np.random.default_rng(0).lognormal(11, 0.7, size))
+    cents = exact.to_cents(incomes)
+    repeat = max(3, min(200, 10 ** 7 // size))
+    results = [timed(f"exact/to_cents/1e{args.max_power}", lambda: exact.to_cents(incomes), repeat, rows=size)]
+    for name, function in calc.COLUMNS.items():
+        results.append(timed(f"exact/float/{name}/1e{args.max_power}", lambda: function(incomes), repeat, rows=size))
+        results.append(timed(f"exact/cents/{name}/1e{args.max_power}",
+                             lambda: exact.EXACT_COLUMNS[name](cents), repeat, rows=size))
+    return results
+
+def suite_calls(args):
+    import numpy as np
+    import calc
+
+    targets = np.linspace(0, 1500, 1000)
+    return [
+        timed('tax_chart', calc.tax_chart, args.calls // 10),
+        timed('goal_seek/scalar', lambda: calc.goal_seek(1000), args.calls // 10),
+        timed('goal_seek/1e3', lambda: calc.goal_seek(targets), args.calls // 10, rows=len(targets)),
+    ]
+
+def suite_app(args):
+    # The whole page as a session sees it: first load, then an income and a click
+    from streamlit.testing.v1 import AppTest
+
+    def render():
+        at = AppTest.from_file(os.path.join(HERE, 'main.py'), default_timeout=120)
+        at.run()
+        at.text_input[0].input('85000').run()
+        at.button[0].click().run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+    return [timed('app/main', render, args.renders)]
+
+SUITES = {
+    'scalar': suite_scalar,
+    'batch': suite_batch,
+    'calls': suite_calls,
+    'exact': suite_exact,
+    'app': suite_app,
+}
+
+def run_suites(names, args):
+    # Each suite runs in its own interpreter so its peak RSS is its own
+    results = []
+    for name in names:
+        command = [sys.executable, os.path.join(HERE, 'bench.py'), '_suite', name,
+                   '--calls', str(args.calls), '--max-power', str(args.max_power), '--renders', str(args.renders)]
+        out = subprocess.run(command, cwd=HERE, check=True, capture_output=True, text=True).stdout
+        results.extend(json.loads(out.strip().splitlines()[-1]))
+    return results
+
+def compare(results, baseline, threshold):
+    # Cases slower or lower in throughput, and suites heavier, than the
+    # baseline by more than threshold
+    before = {case['name']: case for case in baseline}
+    suite_rss = {case['suite']: case['suite_peak_rss_mb'] for case in baseline if 'suite' in case}
+    failures = []
+    for suite, rss in {case['suite']: case['suite_peak_rss_mb'] for case in results}.items():
+        if suite in suite_rss and rss > suite_rss[suite] * (1 + threshold):
+            failures.append(f"{suite} suite: peak RSS {suite_rss[suite]:.0f} -> {rss:.0f} MB")
+    for case in results:
+        old = before.get(case['name'])
+        if old is None:
+            continue
+        if case['p50_us'] > old['p50_us'] * (1 + threshold):
+            failures.append(f"{case['name']}: p50 {old['p50_us']:.1f} -> {case['p50_us']:.1f} us")
+        if case['throughput'] < old['throughput'] * (1 - threshold):
+            failures.append(f"{case['name']}: throughput {old['throughput']:,.0f} -> {case['throughput']:,.0f}/s")
+    return failures
+
+def print_results(results):
+    # Peak RSS is the whole suite's process, so it is shown once per suite
+    suite = None
+    for case in results:
+        if case['suite'] != suite:
+            suite = case['suite']
+            print(f"{suite} suite, peak RSS {case['suite_peak_rss_mb']:.0f} MB")
+        print(f"  {case['name']:<40} p50 {case['p50_us']:>11.1f} us  p99 {case['p99_us']:>11.1f} us  "
+              f"{case['throughput']:>15,.0f}/s")
+
+# Differential check of every fast path against the original loop code in
+# reference.py, at both sides of every threshold and over random incomes
+
+def edge_incomes():
+    import calc
+
+    thresholds = {0.0}
+    for rule in calc.RULES.schedules.values():
+        thresholds.update(rule.schedule.lowers + rule.schedule.uppers)
+        if rule.medicare:
+            thresholds.update(rule.medicare[:2])
+    for offset in calc.RULES.offsets.values():
+        for segment in offset.segments:
+            thresholds.update((segment.lower, segment.upper, segment.start))
+    thresholds = sorted(t for t in thresholds if abs(t) != float('inf'))
+    return sorted({t + d for t in thresholds for d in (-1, -0.5, -0.01, 0, 0.01, 0.5, 1)})
+
+def differential(samples=100_000):
+    import numpy as np
+    import calc
+    import reference
+    from aggregate import PIECEWISE
+    from lookup import LiabilityTable
+
+    rng = np.random.default_rng(0)
+    edges = edge_incomes()
+    incomes = edges + rng.uniform(-1000, 500_000, samples).tolist() + \
+        rng.integers(0, 500_000, samples).astype(float).tolist()
+    array = np.array(incomes)
+    table = LiabilityTable(ceiling=300_000)
+
+    failures = []
+    for name, function in calc.LIABILITIES.items():
+        expected = [getattr(reference, name)(x) for x in incomes]
+        scalar = [function(x) for x in incomes]
+        vector = function(array)
+        bad = [x for x, a, b in zip(incomes, expected, scalar) if a != b]
+        if bad:
+            failures.append(f"{name}: scalar differs at {bad[:5]}")
+        bad = array[vector != np.array(expected, dtype=np.float64)]
+        if len(bad):
+            failures.append(f"{name}: vector differs at {bad[:5].tolist()}")
+        bad = [x for x, a in zip(incomes, expected) if x == int(x) and table[name, x] != int(a)]
+        if bad:
+            failures.append(f"{name}: lookup table differs at {bad[:5]}")
+        gap = np.abs(PIECEWISE[name](array) - np.array(expected))
+        if (gap > 1e-6).any():
+            failures.append(f"{name}: piecewise form off by {gap.max():.3g} at {array[gap.argmax()]}")
+
+    # The chart polylines drawn through each full liability's vertices, and
+    # the fused net liability against the same liability from its pieces
+    from piecewise import liability
+    off_edge = array[len(edges):len(edges) + samples]
+    for key, rule in calc.RULES.schedules.items():
+        x, y = liability(rule).vertices(-1000, 500_000)
+        gap = np.abs(np.interp(off_edge, x, y) - liability(rule)(off_edge))
+        if (gap > 1e-6).any():
+            failures.append(f"{'/'.join(key)}: vertices off by {gap.max():.3g} at {off_edge[gap.argmax()]}")
+        net = calc.net_liability(rule, array)
+        bad = array[net != np.array([calc.net_liability(rule, x) for x in incomes])]
+        if len(bad):
+            failures.append(f"{'/'.join(key)}: net liability vector and scalar differ at {bad[:5].tolist()}")
+        # Summed in another order the pieces can land either side of a whole
+        # dollar, so truncating them may give one less or one more
+        pieces = liability(rule)(array)
+        bad = array[(net != np.trunc(pieces)) & (net != np.trunc(pieces + 1e-6)) & (net != np.trunc(pieces - 1e-6))]
+        if len(bad):
+            failures.append(f"{'/'.join(key)}: net liability differs from its pieces at {bad[:5].tolist()}")
+
+    # The integer cents engine: scalar and vector agree exactly, components
+    # are the float ones truncated to the cent, and the tax payable differs
+    # from the float engine only where the float total fell just short of
+    # a whole dollar it should have reached
+    import exact
+    cents_incomes = np.round(array, 2)
+    cents = exact.to_cents(cents_incomes)
+    for name, function in calc.COLUMNS.items():
+        vector = exact.EXACT_COLUMNS[name](cents)
+        bad = cents_incomes[vector != np.array([exact.EXACT_COLUMNS[name](int(c)) for c in cents])]
+        if len(bad):
+            failures.append(f"{name}: exact vector and scalar differ at {bad[:5].tolist()}")
+        floats = function(cents_incomes) * 100
+        if name in exact.EXACT_NET_LIABILITIES:
+            gap = vector - floats
+            unrounded = liability(function.args[0])(cents_incomes)
+            bad = cents_incomes[(gap != 0) & ((gap != 100) | (np.abs(unrounded - np.round(unrounded)) > 1e-6))]
+        else:
+            bad = cents_incomes[(vector > floats + 1e-6) | (vector < floats - 1 - 1e-6)]
+        if len(bad):
+            failures.append(f"{name}: exact cents differ from the float engine at {bad[:5].tolist()}")
+
+    failures.extend(whatif_check(array))
+    failures.extend(api_check())
+
+    if calc.tax_chart() != reference.tax_chart():
+        failures.append('tax_chart differs')
+    targets = np.linspace(0, 1500, 301)
+    solved = calc.goal_seek(targets)
+    found = ~np.isnan(solved)
+    gap = np.abs(np.array([reference.litmo(x) for x in solved[found]]) - targets[found])
+    if (gap > 1e-6).any():
+        failures.append(f"goal_seek misses {int((gap > 1e-6).sum())} targets, e.g. {targets[found][gap > 1e-6][:5].tolist()}")
+    return len(incomes), failures
+
+def whatif_check(incomes):
+    # WhatIf.evaluate's totals and better/worse off counts against the same
+    # difference evaluated at every income, for the proposed rules and a few
+    # tuned variants of them
+    import numpy as np
+    from piecewise import fresh_liability
+    from whatif import for_residency, with_medicare_floor, with_rate, with_threshold
+
+    failures = []
+    for residency in ('resident', 'non_resident', 'holiday_maker'):
+        whatif, proposed = for_residency(incomes, residency)
+        variants = [proposed, with_threshold(proposed, 0, 20000), with_rate(proposed, 1, 0.2)]
+        if proposed.medicare:
+            variants.append(with_medicare_floor(proposed, 30000))
+        for variant in variants:
+            outcome = whatif.evaluate(variant)
+            gain = whatif.base - fresh_liability(variant)
+            values = gain(whatif.incomes)
+            expected = (int((values > 0).sum()), int((values < 0).sum()))
+            if (outcome.better_off, outcome.worse_off) != expected:
+                failures.append(f"whatif/{residency}: better/worse off {outcome.better_off}/{outcome.worse_off}, "
+                                f"expected {expected[0]}/{expected[1]}")
+            total = fresh_liability(variant)(whatif.incomes).sum()
+            if abs(outcome.proposed - total) > 1e-6 * max(1.0, abs(total)):
+                failures.append(f"whatif/{residency}: total {outcome.proposed} against {total}")
+    return failures
+
+def api_check():
+    # The JSON API through its in-process client: concurrent requests agree
+    # with net_liability, and bad input is a 400 with a JSON error
+    import asyncio
+    import calc
+    from api import Client
+
+    async def requests():
+        client = Client()
+        good = await asyncio.gather(client.calculate(85000), client.calculate([37000, 90000.5], 'non_resident'))
+        bad = await asyncio.gather(*[client.request('POST', '/calculate', payload) for payload in (
+            {'taxable_income': float('nan')}, {'taxable_income': float('inf')}, {'taxable_income': 1e300},
+            {'taxable_income': 10 ** 30}, {'taxable_income': [1, 2], 'residency': [{}, 'resident']},
+            {'taxable_income': 1, 'residency': 'martian'}, {'taxable_income': '85000'}, [])])
+        return good, bad
+
+    (single, batch), bad = asyncio.run(requests())
+    failures = []
+    expected = [(200, 85000, 'resident'), (200, 37000, 'non_resident'), (200, 90000.5, 'non_resident')]
+    got = [(single[0], single[1]['taxable_income'], single[1]['residency'])] + \
+        [(batch[0], row['taxable_income'], row['residency']) for row in batch[1]['results']]
+    if got != expected:
+        failures.append(f"api: expected {expected}, got {got}")
+    for status, row in [(single[0], single[1])] + [(batch[0], row) for row in batch[1]['results']]:
+        name = f"{row['residency']}_current"
+        if row['current'] != calc.NET_LIABILITIES[name](row['taxable_income']):
+            failures.append(f"api: current differs from {name} at {row['taxable_income']}")
+    for status, payload in bad:
+        if status != 400 or 'error' not in payload:
+            failures.append(f"api: bad input answered {status} {payload}")
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks and regression checks for the taxcuts modules.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    imports = commands.add_parser('imports', help='cold import time of each module')
+    imports.add_argument('--repeat', type=int, default=5)
+    imports.add_argument('--max-core-ms', type=float, default=50.0,
+                         help='fail if calc imports slower than this or loads a heavy module')
+
+    def timing_options(command):
+        command.add_argument('suites', nargs='*', default=list(SUITES), help=f"any of {', '.join(SUITES)}")
+        command.add_argument('--calls', type=int, default=20_000, help='timed calls per scalar case')
+        command.add_argument('--max-power', type=int, default=7, help='largest batch is 10**max_power incomes')
+        command.add_argument('--renders', type=int, default=5, help='timed app renders')
+
+    run = commands.add_parser('run', help='run timing suites and optionally save a baseline')
+    timing_options(run)
+    run.add_argument('--save', metavar='JSON', help='write the results as a baseline')
+
+    check = commands.add_parser('check', help='run timing suites and fail on regressions against a baseline')
+    timing_options(check)
+    check.add_argument('--baseline', default='bench_baseline.json')
+    check.add_argument('--threshold', type=float, default=0.25, help='allowed relative regression (default: 0.25)')
+
+    diff = commands.add_parser('diff', help='compare every fast path with the original loop code')
+    diff.add_argument('--samples', type=int, default=100_000)
+
+    suite = commands.add_parser('_suite')
+    suite.add_argument('suite', choices=list(SUITES))
+    suite.add_argument('--calls', type=int)
+    suite.add_argument('--max-power', type=int)
+    suite.add_argument('--renders', type=int)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'imports':
+        results = bench_imports(repeat=args.repeat)
+        for result in results:
+            heavy = ', '.join(result['heavy']) or '-'
+            print(f"{result['module']:<10} {result['median_ms']:8.1f} ms median  {result['min_ms']:8.1f} ms min  heavy: {heavy}")
+        core = results[0]
+        if core['heavy'] or core['median_ms'] > args.max_core_ms:
+            sys.exit(f"calc import too slow or too heavy: {core['median_ms']:.1f} ms, loaded {core['heavy']}")
+
+    elif args.command == '_suite':
+        sys.path.insert(0, HERE)
+        results = SUITES[args.suite](args)
+        # One process runs the whole suite, so this is the suite's peak, not any one case's
+        rss = peak_rss_mb()
+        for case in results:
+            case['suite'] = args.suite
+            case['suite_peak_rss_mb'] = rss
+        print(json.dumps(results))
+
+    elif args.command in ('run', 'check'):
+        unknown = set(args.suites) - set(SUITES)
+        if unknown:
+            parser.error(f"unknown suite: {', '.join(sorted(unknown))}")
+        if args.command == 'check' and not os.path.exists(args.baseline):
+            sys.exit(f"no baseline at {args.baseline}: run `python bench.py run --save {args.baseline}` first")
+        results = run_suites(args.suites, args)
+        print_results(results)
+        if args.command == 'run' and args.save:
+            with open(args.save, 'w') as f:
+                json.dump(results, f, indent=2)
+        if args.command == 'check':
+            with open(args.baseline) as f:
+                failures = compare(results, json.load(f), args.threshold)
+            if failures:
+                sys.exit('Regressions against ' + args.baseline + ':\n  ' + '\n  '.join(failures))
+
+    elif args.command == 'diff':
+        checked, failures = differential(args.samples)
+        if failures:
+            sys.exit('Differences from reference.py:\n  ' + '\n  '.join(failures))
+        print(f"{checked:,} incomes match reference.py across every schedule")
+
+if __name__ == "__main__":
+    main()
@@ -1,198 +1,349 @@
-import streamlit as st
-import matplotlib.pyplot as plt
-import pandas as pd
-from matplotlib.animation import FuncAnimation
-from scipy.optimize import fsolve
+import json
+import os
+import sys
+from bisect import bisect_left
+from collections import namedtuple
+from functools import lru_cache, partial
+from numbers import Number
+from types import MappingProxyType
 
-@st.cache_data
-def proposedtax2025(taxable_income):
-    # https://www.aph.gov.au/Parliamentary_Business/Bills_Legislation/bd/bd2324a/24bd42a
-    tax_brackets = [(0, 18200), (18201, 45000), (45001, 135000), (135001, 190000), (190001, float('inf'))]
-    tax_rates = [0, 0.16, 0.30, 0.37, 0.45]
-    
-    tax = 0.0
-    for i, (lower, upper) in enumerate(tax_brackets):
-        if taxable_income > upper:
-            tax += (upper - lower) * tax_rates[i]
-        elif taxable_income > lower:
-            tax += (taxable_income - lower) * tax_rates[i]
-            break 
-    return tax
+# The pure computation core.  Only the standard library is imported up front:
+# numpy is imported by the array paths when they are first used, and plotting
+# and UI code lives in charts.py and main.py, so a scalar tax number costs no
+# heavy imports at all.
 
-def stage3tax2025(taxable_income):
-    # https://www.aph.gov.au/Parliamentary_Business/Bills_Legislation/bd/bd2324a/24bd42a
-    tax_brackets = [(0, 18200), (18201, 45000), (45001, 200000), (200001, float('inf'))]
-    tax_rates = [0, 0.19, 0.30, 0.45]
-    
+# A bracket schedule compiled once into parallel tables: the lower and upper
+# bound of each bracket, its marginal rate and the tax accumulated by every
+# bracket below it.  Brackets keep the (lower, upper) pairs as legislated, so
+# (18201, 45000) taxes income above 18201 and the $1 between brackets is flat.
+Schedule = namedtuple('Schedule', ['lowers', 'uppers', 'rates', 'base'])
+
+def make_schedule(tax_brackets, tax_rates):
+    lowers = tuple(float(lower) for lower, upper in tax_brackets)
+    uppers = tuple(float(upper) for lower, upper in tax_brackets)
+    rates = tuple(float(rate) for rate in tax_rates)
+
+    # Same running sum the bracket loop used to build up, so results match it to the cent
+    base = []
     tax = 0.0
-    for i, (lower, upper) in enumerate(tax_brackets):
-        if taxable_income > upper:
-            tax += (upper - lower) * tax_rates[i]
-        elif taxable_income > lower:
-            tax += (taxable_income - lower) * tax_rates[i]
-            break 
-    return tax
+    for lower, upper, rate in zip(lowers, uppers, rates):
+        base.append(tax)
+        tax += (upper - lower) * rate
+    return Schedule(lowers, uppers, rates, tuple(base))
 
-def medicare2025(taxable_income):
-    lower_limit = 24276
-    upper_limt = 30345
-    if taxable_income < lower_limit:
-        return 0.0
+def bracket_tax(schedule, taxable_income):
+    # Scalars take a plain Python path, anything array-like is done in one pass
+    if _is_scalar(taxable_income):
+        if taxable_income != taxable_income:
+            return float('nan')
+        i = bisect_left(schedule.uppers, taxable_income)
+        tax = schedule.base[i]
+        if taxable_income > schedule.lowers[i]:
+            tax += (taxable_income - schedule.lowers[i]) * schedule.rates[i]
+        return tax
 
-    # Calculate the Medicare Levy for income above the lower threshold
-    medicare_levy = (taxable_income - lower_limit) * 0.015
+    import numpy as np
 
-    # Apply the Medicare Levy Surcharge if applicable
-    if taxable_income >=  upper_limt:
-        medicare_levy_rate = 0.02
-        medicare = taxable_income * medicare_levy_rate
-        medicare_levy += medicare
-    return medicare_levy
+    # Same index searchsorted would give, but a handful of sequential compares
+    # beats its binary search on large unsorted arrays
+    income = np.asarray(taxable_income, dtype=np.float64)
+    i = np.zeros(income.shape, dtype=np.uint8)
+    for upper in schedule.uppers[:-1]:
+        i += income > upper
+    tax = np.subtract(income, np.take(schedule.lowers, i))
+    np.maximum(tax, 0.0, out=tax)
+    np.multiply(tax, np.take(schedule.rates, i), out=tax)
+    np.add(tax, np.take(schedule.base, i), out=tax)
+    return _like(taxable_income, tax)
+
+def _is_scalar(taxable_income):
+    # Plain numbers (numpy scalars included) never need numpy
+    if isinstance(taxable_income, Number):
+        return True
+    import numpy as np
+    return np.ndim(taxable_income) == 0
+
+def _like(taxable_income, values):
+    # Hand a Series back for a Series so callers keep their index.  Only pandas
+    # itself makes Series, so if it isn't loaded there is nothing to check.
+    pd = sys.modules.get('pandas')
+    if pd is not None and isinstance(taxable_income, pd.Series):
+        return pd.Series(values, index=taxable_income.index, name=taxable_income.name)
+    return values
+
+# Offsets are inclusive income segments checked in order.  The first one an
+# income falls in gives amount + taper * (income - start), capped at cap, and
+# an income outside every segment gets nothing.
+Offset = namedtuple('Offset', ['name', 'segments'])
+Segment = namedtuple('Segment', ['lower', 'upper', 'amount', 'taper', 'start', 'cap'])
+
+def make_offset(name, segments):
+    return Offset(name, tuple(
+        Segment(float('-inf') if segment.get('lower') is None else float(segment['lower']),
+                float('inf') if segment.get('upper') is None else float(segment['upper']),
+                float(segment['amount']),
+                float(segment.get('taper', 0)),
+                float(segment.get('from', 0)),
+                float(segment.get('cap', float('inf'))))
+        for segment in segments))
+
+def offset_amount(offset, taxable_income):
+    if not _is_scalar(taxable_income):
+        import numpy as np
+        income = np.asarray(taxable_income, dtype=np.float64)
+        conditions = []
+        choices = []
+        for segment in offset.segments:
+            conditions.append((segment.lower <= income) & (income <= segment.upper))
+            if segment.taper:
+                amount = segment.amount + ((income - segment.start) * segment.taper)
+            else:
+                amount = np.full(income.shape, segment.amount)
+            choices.append(np.minimum(amount, segment.cap))
+        amount = np.maximum(np.select(conditions, choices, 0.0), 0)
+        # An income that isn't a number is in no segment, but gets nan, not
+        # nil, like every other liability
+        amount[np.isnan(income)] = np.nan
+        return _like(taxable_income, amount)
+
+    if taxable_income != taxable_income:
+        return float('nan')
+    for segment in offset.segments:
+        if segment.lower <= taxable_income <= segment.upper:
+            amount = segment.amount
+            if segment.taper:
+                amount += (taxable_income - segment.start) * segment.taper
+            return max(min(amount, segment.cap), 0)
+    return 0
+
+# Brackets, rates, Medicare thresholds and offsets live in rules.json, one
+# entry per income year, residency and policy.  Each file is compiled once and
+# the result is read only, so every caller shares the same tables.
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+
+Rules = namedtuple('Rules', ['version', 'schedules', 'offsets'])
+Rule = namedtuple('Rule', ['year', 'residency', 'policy', 'schedule', 'medicare', 'offsets', 'source'])
+Medicare = namedtuple('Medicare', ['lower_limit', 'upper_limit', 'shade_in_rate', 'rate'])
+
+@lru_cache(maxsize=None)
+def load_rules(path=RULES_FILE):
+    with open(path) as f:
+        data = json.load(f)
+
+    offsets = {name: make_offset(name, offset['segments']) for name, offset in data.get('offsets', {}).items()}
+    schedules = {}
+    for entry in data['schedules']:
+        key = (entry['year'], entry['residency'], entry['policy'])
+        if key in schedules:
+            raise ValueError(f"{path}: more than one schedule for {key}")
+        tax_brackets = [(lower, float('inf') if upper is None else upper) for lower, upper in entry['brackets']]
+        medicare = Medicare(**entry['medicare']) if entry.get('medicare') else None
+        schedules[key] = Rule(*key,
+                              make_schedule(tax_brackets, entry['rates']),
+                              medicare,
+                              tuple(offsets[name] for name in entry.get('offsets', ())),
+                              entry.get('source'))
+    return Rules(data.get('version'), MappingProxyType(schedules), MappingProxyType(offsets))
+
+def rule(year, residency, policy, path=RULES_FILE):
+    try:
+        return load_rules(path).schedules[year, residency, policy]
+    except KeyError:
+        raise KeyError(f"no schedule for {year} {residency} {policy}") from None
+
+def evaluate(taxable_income, year=None, residency=None, policy=None, path=RULES_FILE):
+    # Every component of every schedule matching the filters (None matches
+    # anything), as {(year, residency, policy): {'tax': ..., 'medicare': ..., offset name: ...}}
+    results = {}
+    for key, entry in load_rules(path).schedules.items():
+        if any(want is not None and want != have for want, have in zip((year, residency, policy), key)):
+            continue
+        components = {'tax': bracket_tax(entry.schedule, taxable_income)}
+        if entry.medicare:
+            components['medicare'] = medicare_levy(taxable_income, *entry.medicare)
+        for offset in entry.offsets:
+            components[offset.name] = offset_amount(offset, taxable_income)
+        results[key] = components
+    return results
+
+RULES = load_rules()
+
+# Residents, Stage 3 as revised (Labor)
+PROPOSED_2025 = rule('2024-25', 'resident', 'proposed').schedule
+
+# Residents, Stage 3 as legislated (Liberal)
+STAGE3_2025 = rule('2024-25', 'resident', 'legislated').schedule
+
+# Non residents
+NR_2025 = rule('2024-25', 'non_resident', 'legislated').schedule
+
+# Non residents, revised
+PROPOSED_NR_2025 = rule('2024-25', 'non_resident', 'proposed').schedule
+
+# Working holiday makers
+HM_2025 = rule('2024-25', 'holiday_maker', 'legislated').schedule
+
+# Working holiday makers, revised
+PROPOSED_HM_2025 = rule('2024-25', 'holiday_maker', 'proposed').schedule
+
+# Residents, 2023-24 rates
+PRIOR_2024 = rule('2023-24', 'resident', 'current').schedule
+
+MEDICARE_2025 = rule('2024-25', 'resident', 'legislated').medicare
+PROPOSED_MEDICARE_2025 = rule('2024-25', 'resident', 'proposed').medicare
+
+LITO = RULES.offsets['lito']
+LITMO = RULES.offsets['litmo']
+
+def proposedtax2025(taxable_income):
+    return bracket_tax(PROPOSED_2025, taxable_income)
+
+def stage3tax2025(taxable_income):
+    return bracket_tax(STAGE3_2025, taxable_income)
+
+def medicare_levy(taxable_income, lower_limit, upper_limt, shade_in_rate=0.015, medicare_levy_rate=0.02):
+    if not _is_scalar(taxable_income):
+        import numpy as np
+        income = np.asarray(taxable_income, dtype=np.float64)
+        medicare_levy = (income - lower_limit) * shade_in_rate
+        medicare_levy += np.where(income >= upper_limt, income * medicare_levy_rate, 0.0)
+        medicare_levy[income < lower_limit] = 0.0
+        return _like(taxable_income, medicare_levy)
 
-def proposed_medicare2025(taxable_income):
-    lower_limit = 26000
-    upper_limt = 32500
     if taxable_income < lower_limit:
         return 0.0
 
     # Calculate the Medicare Levy for income above the lower threshold
-    medicare_levy = (taxable_income - lower_limit) * 0.015
+    medicare_levy = (taxable_income - lower_limit) * shade_in_rate
 
     # Apply the Medicare Levy Surcharge if applicable
     if taxable_income >=  upper_limt:
-        medicare_levy_rate = 0.02
         medicare = taxable_income * medicare_levy_rate
         medicare_levy += medicare
     return medicare_levy
 
+def medicare2025(taxable_income):
+    return medicare_levy(taxable_income, *MEDICARE_2025)
+
+def proposed_medicare2025(taxable_income):
+    return medicare_levy(taxable_income, *PROPOSED_MEDICARE_2025)
+
 def nrtax2025(taxable_income):
-    # https://www.aph.gov.au/Parliamentary_Business/Bills_Legislation/bd/bd2324a/24bd42a
-    tax_brackets = [(0, 200000), (200001, float('inf'))]
-    tax_rates = [0.30, 0.45]
-    
-    tax = 0.0
-    for i, (lower, upper) in enumerate(tax_brackets):
-        if taxable_income > upper:
-            tax += (upper - lower) * tax_rates[i]
-        elif taxable_income > lower:
-            tax += (taxable_income - lower) * tax_rates[i]
-            break 
-    return tax
+    return bracket_tax(NR_2025, taxable_income)
 
 def proposed_nrtax2025(taxable_income):
-    # https://www.aph.gov.au/Parliamentary_Business/Bills_Legislation/bd/bd2324a/24bd42a
-    tax_brackets = [(0, 135000), (135001, 190000), (190001, float('inf'))]
-    tax_rates = [0.30, 0.37, 0.45]
-    
-    tax = 0.0
-    for i, (lower, upper) in enumerate(tax_brackets):
-        if taxable_income > upper:
-            tax += (upper - lower) * tax_rates[i]
-        elif taxable_income > lower:
-            tax += (taxable_income - lower) * tax_rates[i]
-            break 
-    return tax
+    return bracket_tax(PROPOSED_NR_2025, taxable_income)
 
 def hmtax2025(taxable_income):
-    # https://www.aph.gov.au/Parliamentary_Business/Bills_Legislation/bd/bd2324a/24bd42a
-    tax_brackets = [(0, 45000), (45001, 200000), (200001, float('inf'))]
-    tax_rates = [0.15, 0.30, 0.45]
-    
-    tax = 0.0
-    for i, (lower, upper) in enumerate(tax_brackets):
-        if taxable_income > upper:
-            tax += (upper - lower) * tax_rates[i]
-        elif taxable_income > lower:
-            tax += (taxable_income - lower) * tax_rates[i]
-            break 
-    return tax
+    return bracket_tax(HM_2025, taxable_income)
 
 def proposed_hmtax2025(taxable_income):
-    # https://www.aph.gov.au/Parliamentary_Business/Bills_Legislation/bd/bd2324a/24bd42a
-    tax_brackets = [(0, 45000), (45001, 135000), (135001, 190000), (190001, float('inf'))]
-    tax_rates = [0.15, 0.30, 0.37, 0.45]
-    
-    tax = 0.0
-    for i, (lower, upper) in enumerate(tax_brackets):
-        if taxable_income > upper:
-            tax += (upper - lower) * tax_rates[i]
-        elif taxable_income > lower:
-            tax += (taxable_income - lower) * tax_rates[i]
-            break 
-    return tax
+    return bracket_tax(PROPOSED_HM_2025, taxable_income)
 
 def lito(taxable_income):
     # ATO low income tax offset calculation
-    if taxable_income <= 37000:
-        lito = 700
-    elif 37501 <= taxable_income <= 45000:
-        lito = 700 - ((taxable_income - 37500) * 0.05)
-    elif 45001 <= taxable_income <= 66666:
-        lito = 325 - ((taxable_income - 45000) * 0.015)
-    else:
-        lito = 0
-    return max(lito, 0)
+    return offset_amount(LITO, taxable_income)
 
 def litmo(taxable_income):
-    # ATO low income tax offset calculation
-    if taxable_income <= 37000:
-        litmo = 675
-    elif 37501 <= taxable_income <= 48000:
-        litmo = min(675 + ((taxable_income - 37500) * 0.05),1500)
-    elif 45001 <= taxable_income <= 90000:
-        litmo = 1500 
-    elif 90001 <= taxable_income <= 126000:
-        litmo = 1500 - ((taxable_income - 90001) * 0.3)
-    else:
-        litmo = 0
-    return max(litmo, 0)
+    # ATO low and middle income tax offset calculation
+    return offset_amount(LITMO, taxable_income)
 
 def prior_tax2024(taxable_income):
-    # https://www.aph.gov.au/Parliamentary_Business/Bills_Legislation/bd/bd2324a/24bd42a
-    tax_brackets = [(0, 18200), (18201, 45000), (45001, 120000), (120001, 180000), (180001, float('inf'))]
-    tax_rates = [0, 0.19, 0.325, 0.37, 0.45]
-    
-    tax = 0.0
-    for i, (lower, upper) in enumerate(tax_brackets):
-        if taxable_income > upper:
-            tax += (upper - lower) * tax_rates[i]
-        elif taxable_income > lower:
-            tax += (taxable_income - lower) * tax_rates[i]
-            break 
-    return tax
+    return bracket_tax(PRIOR_2024, taxable_income)
 
-def tax_chart():
-    taxable_income_range = [10000, 20000, 30000, 40000, 50000, 60000, 70000, 80000, 90000, 100000, 110000, 120000, 130000, 140000, 150000, 160000, 170000, 180000, 190000, 200000, 210000, 220000, 230000]
-    prior_liability = []
-    tax_liability = []
-    proposed_tax_liability =[]
-
-    for i in taxable_income_range:
-        prior_tax = int(prior_tax2024(i))
-        tax_range = int(stage3tax2025(i))
-        proposed_tax_range = int(proposedtax2025(i))
-        prior_liability.append(prior_tax)
-        tax_liability.append(tax_range)
-        proposed_tax_liability.append(proposed_tax_range)
+# Every liability and offset by name, each taking a scalar or an array
+LIABILITIES = {
+    'prior_tax2024': partial(bracket_tax, PRIOR_2024),
+    'stage3tax2025': partial(bracket_tax, STAGE3_2025),
+    'proposedtax2025': partial(bracket_tax, PROPOSED_2025),
+    'nrtax2025': partial(bracket_tax, NR_2025),
+    'proposed_nrtax2025': partial(bracket_tax, PROPOSED_NR_2025),
+    'hmtax2025': partial(bracket_tax, HM_2025),
+    'proposed_hmtax2025': partial(bracket_tax, PROPOSED_HM_2025),
+    'medicare2025': medicare2025,
+    'proposed_medicare2025': proposed_medicare2025,
+    'lito': lito,
+    'litmo': litmo,
+}
 
-    return taxable_income_range, prior_liability, tax_liability, proposed_tax_liability
+# Resident, non resident and holiday maker comparisons as (current, proposed)
+# LIABILITIES names, summed the same way main.main() builds its difference figures
+COMPARISONS = {
+    'resident': (('stage3tax2025', 'medicare2025'), ('proposedtax2025', 'proposed_medicare2025')),
+    'non_resident': (('nrtax2025',), ('proposed_nrtax2025',)),
+    'holiday_maker': (('hmtax2025',), ('proposed_hmtax2025',)),
+}
 
-def goal_seek(target_litmo):
+def net_liability(rule, taxable_income):
+    # Tax payable under one rules.json entry: bracket tax less its offsets,
+    # which are non-refundable so they take the tax to nil but no further and
+    # never reduce the Medicare levy, plus the levy.  Nothing is rounded until
+    # the end, where the total is truncated to the whole dollars the app shows
+    # (still floats for arrays, so an income that isn't a number stays nan).
+    if _is_scalar(taxable_income):
+        tax = bracket_tax(rule.schedule, taxable_income)
+        for offset in rule.offsets:
+            tax -= offset_amount(offset, taxable_income)
+        tax = max(tax, 0.0)
+        if rule.medicare:
+            tax += medicare_levy(taxable_income, *rule.medicare)
+        return int(tax)
+
+    import numpy as np
 
-    def equation(taxable_income):
-        return litmo(taxable_income) - target_litmo
+    # One pass over the incomes with two scratch arrays, every step in place
+    income = np.asarray(taxable_income, dtype=np.float64)
+    tax = np.asarray(bracket_tax(rule.schedule, income))
+    scratch = np.empty_like(income)
+    amount = np.empty_like(income)
+    for offset in rule.offsets:
+        # Later segments first, so the first segment an income falls in wins
+        amount.fill(0.0)
+        for segment in reversed(offset.segments):
+            np.subtract(income, segment.start, out=scratch)
+            np.multiply(scratch, segment.taper, out=scratch)
+            np.add(scratch, segment.amount, out=scratch)
+            np.minimum(scratch, segment.cap, out=scratch)
+            np.copyto(amount, scratch, where=(segment.lower <= income) & (income <= segment.upper))
+        np.maximum(amount, 0.0, out=amount)
+        np.subtract(tax, amount, out=tax)
+    np.maximum(tax, 0.0, out=tax)
+    if rule.medicare:
+        lower_limit, upper_limit, shade_in_rate, rate = rule.medicare
+        np.subtract(income, lower_limit, out=scratch)
+        np.multiply(scratch, shade_in_rate, out=scratch)
+        np.maximum(scratch, 0.0, out=scratch)
+        np.multiply(income, rate, out=amount)
+        np.add(scratch, amount, out=scratch, where=income >= upper_limit)
+        np.add(tax, scratch, out=tax)
+    np.trunc(tax, out=tax)
+    return _like(taxable_income, tax)
 
-    # Initial guess for taxable income (adjust as needed)
-    initial_guess = None
+# Tax payable on each side of every comparison, offsets and Medicare included,
+# as {residency}_current and {residency}_proposed
+NET_LIABILITIES = {
+    f"{residency}_{side}": partial(net_liability, rule('2024-25', residency, policy))
+    for residency in COMPARISONS
+    for side, policy in (('current', 'legislated'), ('proposed', 'proposed'))
+}
 
-    # Using fsolve to find the root of the equation
-    result = fsolve(equation, initial_guess)
+# Every column batch and lookup tables produce: each liability and offset on
+# its own, then the tax payable on each side of every comparison
+COLUMNS = {**LIABILITIES, **NET_LIABILITIES}
 
-    return result[0]
+def tax_chart():
+    import numpy as np
 
-def load_data(file_path):
-    return pd.read_csv(file_path)
+    taxable_income_range = [10000, 20000, 30000, 40000, 50000, 60000, 70000, 80000, 90000, 100000, 110000, 120000, 130000, 140000, 150000, 160000, 170000, 180000, 190000, 200000, 210000, 220000, 230000]
+    incomes = np.array(taxable_income_range, dtype=np.float64)
+    prior_liability = np.trunc(bracket_tax(PRIOR_2024, incomes)).astype(int).tolist()
+    tax_liability = np.trunc(bracket_tax(STAGE3_2025, incomes)).astype(int).tolist()
+    proposed_tax_liability = np.trunc(bracket_tax(PROPOSED_2025, incomes)).astype(int).tolist()
 
-def animate(i, x_data, y_data):
-    plt.cla()  # Clear the current axis
-    plt.plot(x_data[:i+1], y_data[:i+1])
+    return taxable_income_range, prior_liability, tax_liability, proposed_tax_liability
+
+def goal_seek(target_litmo):
+    # Lowest taxable income with a LITMO of target_litmo, solved exactly from
+    # the offset's tapers (nan if no income gets it).  Takes an array of targets too.
+    from piecewise import income_for_offset
+    return income_for_offset(LITMO, target_litmo)
@@ -0,0 +1,238 @@
+import hashlib
+import io
+import json
+import threading
+
+from instrument import count, span
+
+# Plotting and data loading for the Streamlit app.  pandas and matplotlib are
+# imported by the functions that use them, so importing this module is cheap.
+
+# Same output st.pyplot produces
+SAVEFIG_OPTIONS = {'bbox_inches': 'tight', 'dpi': 200}
+
+# Rendered chart bytes shared by every session in the process, keyed by chart
+# name, a hash of the data and the render parameters.  pyplot keeps global
+# state, so rendering is done one figure at a time under the lock.
+_rendered = {}
+_render_lock = threading.Lock()
+
+def load_data(file_path):
+    import pandas as pd
+    return pd.read_csv(file_path)
+
+def revenue_figure(gdf):
+    import matplotlib.pyplot as plt
+
+    x = gdf['Government Revenue']
+    y = gdf['Total individuals and other withholding']
+    y1 = gdf['Projected']
+
+    # Create a figure and axis object
+    fig, ax = plt.subplots()
+
+    # Plot the data
+    ax.plot(x, y1, label='Projected Revenue', color = 'red', linestyle = '--')
+    ax.plot(x, y, label='Government Revenue')
+
+    # Customize the plot
+    ax.set_xlabel('Years')
+    ax.set_ylabel('Dollars')
+    ax.legend()
+    ax.set_yticklabels([])
+    ax.set_xticklabels([])
+
+    # Annotated notes
+    ax.annotate('2008', xy=(2, 125992), xytext=(2, 150000),
+                arrowprops=dict(facecolor='black', shrink=0.1, width = 0.05, headwidth = 3))
+    ax.annotate('2012', xy=(7, 160203), xytext=(7, 200000),
+        arrowprops=dict(facecolor='black', shrink=0.1, width = 0.05, headwidth = 3))
+    ax.annotate('2018', xy=(14, 228445), xytext=(14, 150000),
+        arrowprops=dict(facecolor='black', shrink=0.1, width = 0.05, headwidth = 3))
+    ax.annotate('We are here', xy=(17, 303200), xytext=(17, 200000),
+        arrowprops=dict(facecolor='black', shrink=0.1, width = 0.05, headwidth = 3))
+    return fig
+
+def pain_train_figure(df):
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+    # One line per schedule through its exact vertices
+    for schedule, curve in df.groupby('Schedule', sort=False):
+        ax.plot(curve['Taxable Income'], curve['Tax Liability'], label=schedule)
+
+    # Customize the plot
+    ax.set_xlabel('Taxable Income')
+    ax.set_ylabel('Tax Liability')
+    ax.set_title('Tax Liability Comparison')
+    ax.legend()
+    return fig
+
+def rates_figure(df):
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+    # Same colour per schedule, dashed for the effective rate
+    colours = {schedule: f"C{i}" for i, schedule in enumerate(df['Schedule'].unique())}
+    for (schedule, kind), curve in df.groupby(['Schedule', 'Rate'], sort=False):
+        ax.plot(curve['Taxable Income'], curve['Percent'], label=f"{kind} ({schedule})",
+                color=colours[schedule], linestyle='-' if kind == 'Marginal' else '--')
+
+    ax.set_xlabel('Taxable Income')
+    ax.set_ylabel('Rate (%)')
+    ax.set_title('Marginal and Effective Rates')
+    ax.legend()
+    return fig
+
+# Figure builders by chart name, each taking a DataFrame
+FIGURES = {
+    'revenue': revenue_figure,
+    'pain_train': pain_train_figure,
+    'rates': rates_figure,
+}
+
+# Exact curves for the charts, built from the breakpoints of each schedule
+# rather than by evaluating it on a grid
+PAIN_TRAIN = {
+    'Current Tax Rates (2024)': ('2023-24', 'resident', 'current'),
+    'Stage 3 Tax Cuts (Liberal)': ('2024-25', 'resident', 'legislated'),
+    'Proposed Stage 3 Tax Cuts (Labor)': ('2024-25', 'resident', 'proposed'),
+}
+
+RATE_POLICIES = {'legislated': 'Liberal', 'proposed': 'Labor'}
+
+def pain_train_curves(lower=0, upper=230000):
+    # Bracket tax of each schedule in the pain overview, as in tax_chart()
+    import pandas as pd
+    from calc import RULES
+    from piecewise import from_schedule
+
+    frames = []
+    for name, key in PAIN_TRAIN.items():
+        x, y = from_schedule(RULES.schedules[key].schedule).vertices(lower, upper)
+        frames.append(pd.DataFrame({'Taxable Income': x, 'Schedule': name, 'Tax Liability': y}))
+    return pd.concat(frames, ignore_index=True)
+
+def rate_curves(residency, year='2024-25', lower=0, upper=250000):
+    # Marginal and effective rate of the full liability (tax less offsets plus
+    # Medicare) under each policy, in percent
+    import pandas as pd
+    from calc import rule
+    from piecewise import liability
+
+    frames = []
+    for policy, name in RATE_POLICIES.items():
+        total = liability(rule(year, residency, policy))
+        for kind, (x, y) in (('Marginal', total.marginal_rate().vertices(lower, upper)),
+                             ('Effective', total.effective_rate_vertices(lower, upper))):
+            frames.append(pd.DataFrame({'Taxable Income': x, 'Schedule': name, 'Rate': kind, 'Percent': 100 * y}))
+    return pd.concat(frames, ignore_index=True)
+
+def data_hash(df):
+    # Content hash of a DataFrame: values, index and column names
+    import pandas as pd
+
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    digest.update(json.dumps([str(c) for c in df.columns]).encode())
+    return digest.hexdigest()
+
+def render(fig, fmt='png', **options):
+    # Figure to PNG bytes or SVG text, closing it so pyplot lets it go
+    import matplotlib.pyplot as plt
+
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format=fmt, **{**SAVEFIG_OPTIONS, **options})
+    finally:
+        plt.close(fig)
+    return buffer.getvalue().decode('utf-8') if fmt == 'svg' else buffer.getvalue()
+
+def cached_chart(name, df, fmt='png', **options):
+    # Render chart name for df once per process and hand the same bytes to
+    # every caller after that
+    key = (name, data_hash(df), fmt, tuple(sorted(options.items())))
+    count('cached_chart', 'call')
+    image = _rendered.get(key)
+    if image is None:
+        with _render_lock:
+            image = _rendered.get(key)
+            if image is None:
+                count('cached_chart', 'miss')
+                with span(f"render:{name}"):
+                    image = render(FIGURES[name](df), fmt, **options)
+                _rendered[key] = image
+    return image
+
+def clear_chart_cache():
+    _rendered.clear()
+
+# Vega-Lite specs for the same charts, so the browser draws them from the data
+# and the server does no rasterizing at all
+def revenue_spec(gdf):
+    years = gdf['Government Revenue'].tolist()
+    notes = [(years[2], 125992, '2008'), (years[7], 160203, '2012'),
+             (years[14], 228445, '2018'), (years[17], 303200, 'We are here')]
+    data = gdf.rename(columns={'Government Revenue': 'Year',
+                               'Total individuals and other withholding': 'Government Revenue',
+                               'Projected': 'Projected Revenue'})
+    values = data.melt('Year', ['Projected Revenue', 'Government Revenue'], 'Series', 'Dollars')
+    x = {'field': 'Year', 'type': 'ordinal', 'sort': None, 'title': 'Years', 'axis': {'labels': False}}
+    return {
+        'layer': [
+            {
+                'data': {'values': values.dropna().to_dict('records')},
+                'mark': 'line',
+                'encoding': {
+                    'x': x,
+                    'y': {'field': 'Dollars', 'type': 'quantitative', 'axis': {'labels': False}},
+                    'color': {'field': 'Series', 'type': 'nominal',
+                              'scale': {'domain': ['Projected Revenue', 'Government Revenue'],
+                                        'range': ['red', '#1f77b4']}},
+                    'strokeDash': {'field': 'Series', 'type': 'nominal', 'legend': None,
+                                   'scale': {'domain': ['Projected Revenue', 'Government Revenue'],
+                                             'range': [[4, 4], [1, 0]]}},
+                },
+            },
+            {
+                'data': {'values': [{'Year': year, 'Dollars': dollars, 'Note': note} for year, dollars, note in notes]},
+                'mark': {'type': 'text', 'dy': -20},
+                'encoding': {'x': x, 'y': {'field': 'Dollars', 'type': 'quantitative'}, 'text': {'field': 'Note'}},
+            },
+        ],
+    }
+
+def pain_train_spec(df):
+    return {
+        'title': 'Tax Liability Comparison',
+        'data': {'values': df.to_dict('records')},
+        'mark': 'line',
+        'encoding': {
+            'x': {'field': 'Taxable Income', 'type': 'quantitative'},
+            'y': {'field': 'Tax Liability', 'type': 'quantitative'},
+            'color': {'field': 'Schedule', 'type': 'nominal', 'sort': None},
+            'order': {'field': 'index'},
+        },
+        'transform': [{'window': [{'op': 'row_number', 'as': 'index'}]}],
+    }
+
+def rates_spec(df):
+    return {
+        'title': 'Marginal and Effective Rates',
+        'data': {'values': df.to_dict('records')},
+        'mark': 'line',
+        'encoding': {
+            'x': {'field': 'Taxable Income', 'type': 'quantitative'},
+            'y': {'field': 'Percent', 'type': 'quantitative', 'title': 'Rate (%)'},
+            'color': {'field': 'Schedule', 'type': 'nominal', 'sort': None},
+            'strokeDash': {'field': 'Rate', 'type': 'nominal', 'sort': None},
+            'detail': {'field': 'Rate'},
+            'order': {'field': 'index'},
+        },
+        'transform': [{'window': [{'op': 'row_number', 'as': 'index'}]}],
+    }
+
+def animate(i, x_data, y_data):
+    import matplotlib.pyplot as plt
+
+    plt.cla()  # Clear the current axis
+    plt.plot(x_data[:i+1], y_data[:i+1])
@@ -0,0 +1,237 @@
+from bisect import bisect_left
+from collections import namedtuple
+from functools import lru_cache, partial
+
+from calc import (COMPARISONS, HM_2025, LITMO, LITO, MEDICARE_2025, NR_2025, PRIOR_2024, PROPOSED_2025,
+                  PROPOSED_HM_2025, PROPOSED_MEDICARE_2025, PROPOSED_NR_2025, STAGE3_2025, _is_scalar, _like, rule)
+
+# The same rules as calc.py in integer arithmetic.  Incomes are int64 cents,
+# every rate and taper is an integer numerator over RATE_SCALE, and amounts
+# are carried in units of 1/RATE_SCALE of a cent, where every product of an
+# income and a rate is a whole number.  Nothing is rounded until the result:
+# components are truncated to the cent and the tax payable to the whole
+# dollar, so results are exact, the same on every machine, and sums of them
+# don't depend on the order or sharding they are added in.
+#
+# Every function here takes and returns cents, as Python ints for scalars
+# and int64 arrays otherwise.
+
+RATE_SCALE = 10_000
+
+# Largest income in cents, so that an income times a rate numerator, plus a
+# bracket's base tax, stays well inside int64
+MAX_CENTS = 10 ** 13
+
+# Stands in for an unbounded bracket or offset segment
+_UNBOUNDED = 2 ** 62
+
+ExactSchedule = namedtuple('ExactSchedule', ['lowers', 'uppers', 'rates', 'base'])
+ExactSegment = namedtuple('ExactSegment', ['lower', 'upper', 'amount', 'taper', 'start', 'cap'])
+ExactMedicare = namedtuple('ExactMedicare', ['lower_limit', 'upper_limit', 'shade_in_rate', 'rate'])
+
+def to_cents(taxable_income):
+    # Dollars to whole cents, rounded to the nearest cent
+    if _is_scalar(taxable_income):
+        if taxable_income != taxable_income or abs(taxable_income) * 100 > MAX_CENTS:
+            raise ValueError(f"income {taxable_income!r} has no exact cents")
+        return int(taxable_income) * 100 if float(taxable_income).is_integer() else round(taxable_income * 100)
+
+    import numpy as np
+
+    income = np.asarray(taxable_income)
+    if np.issubdtype(income.dtype, np.integer):
+        cents = income.astype(np.int64) * 100
+    else:
+        cents = np.rint(np.multiply(income, 100, dtype=np.float64))
+    if cents.size and not (np.abs(cents) <= MAX_CENTS).all():
+        raise ValueError("incomes must be finite and at most MAX_CENTS cents")
+    return _like(taxable_income, cents.astype(np.int64, copy=False))
+
+def _cents(dollars):
+    cents = dollars * 100
+    if abs(cents) == float('inf'):
+        return _UNBOUNDED if cents > 0 else -_UNBOUNDED
+    if cents != round(cents):
+        raise ValueError(f"{dollars!r} is not a whole number of cents")
+    return int(round(cents))
+
+def _numerator(rate):
+    numerator = round(rate * RATE_SCALE)
+    if abs(numerator - rate * RATE_SCALE) > 1e-6:
+        raise ValueError(f"rate {rate!r} is not a whole number of 1/{RATE_SCALE}")
+    return numerator
+
+@lru_cache(maxsize=None)
+def exact_schedule(schedule):
+    lowers = tuple(_cents(lower) for lower in schedule.lowers)
+    uppers = tuple(_cents(upper) for upper in schedule.uppers)
+    rates = tuple(_numerator(rate) for rate in schedule.rates)
+    base = []
+    tax = 0
+    for lower, upper, rate in zip(lowers, uppers, rates):
+        base.append(tax)
+        tax += (upper - lower) * rate
+    return ExactSchedule(lowers, uppers, rates, tuple(base))
+
+@lru_cache(maxsize=None)
+def exact_offset(offset):
+    # The segments of a calc.Offset, with amounts and caps in units
+    return tuple(ExactSegment(_cents(segment.lower), _cents(segment.upper),
+                              _cents(segment.amount) * RATE_SCALE, _numerator(segment.taper),
+                              _cents(segment.start),
+                              None if segment.cap == float('inf') else _cents(segment.cap) * RATE_SCALE)
+                 for segment in offset.segments)
+
+@lru_cache(maxsize=None)
+def exact_medicare(medicare):
+    lower_limit, upper_limit, shade_in_rate, rate = medicare
+    return ExactMedicare(_cents(lower_limit), _cents(upper_limit), _numerator(shade_in_rate), _numerator(rate))
+
+# Each of these returns units; callers truncate
+
+def _bracket_units(schedule, cents):
+    if _is_scalar(cents):
+        i = bisect_left(schedule.uppers, cents)
+        return schedule.base[i] + max(cents - schedule.lowers[i], 0) * schedule.rates[i]
+
+    import numpy as np
+
+    i = np.zeros(cents.shape, dtype=np.uint8)
+    for upper in schedule.uppers[:-1]:
+        i += cents > upper
+    units = np.subtract(cents, np.take(schedule.lowers, i))
+    np.maximum(units, 0, out=units)
+    np.multiply(units, np.take(schedule.rates, i), out=units)
+    np.add(units, np.take(schedule.base, i), out=units)
+    return units
+
+def _offset_units(segments, cents, out=None, scratch=None):
+    if _is_scalar(cents):
+        for segment in segments:
+            if segment.lower <= cents <= segment.upper:
+                amount = segment.amount + segment.taper * (cents - segment.start)
+                if segment.cap is not None:
+                    amount = min(amount, segment.cap)
+                return max(amount, 0)
+        return 0
+
+    import numpy as np
+
+    amount = np.zeros(cents.shape, dtype=np.int64) if out is None else out
+    amount.fill(0)
+    scratch = np.empty_like(cents) if scratch is None else scratch
+    # Later segments first, so the first segment an income falls in wins
+    for segment in reversed(segments):
+        inside = (segment.lower <= cents) & (cents <= segment.upper)
+        if segment.taper:
+            np.subtract(cents, segment.start, out=scratch)
+            np.multiply(scratch, segment.taper, out=scratch)
+            np.add(scratch, segment.amount, out=scratch)
+            if segment.cap is not None:
+                np.minimum(scratch, segment.cap, out=scratch)
+            np.copyto(amount, scratch, where=inside)
+        else:
+            value = segment.amount if segment.cap is None else min(segment.amount, segment.cap)
+            np.copyto(amount, value, where=inside)
+    np.maximum(amount, 0, out=amount)
+    return amount
+
+def _medicare_units(medicare, cents, out=None, scratch=None):
+    lower_limit, upper_limit, shade_in_rate, rate = medicare
+    if _is_scalar(cents):
+        if cents < lower_limit:
+            return 0
+        units = (cents - lower_limit) * shade_in_rate
+        if cents >= upper_limit:
+            units += cents * rate
+        return units
+
+    import numpy as np
+
+    units = np.empty_like(cents) if out is None else out
+    scratch = np.empty_like(cents) if scratch is None else scratch
+    np.subtract(cents, lower_limit, out=units)
+    np.multiply(units, shade_in_rate, out=units)
+    np.maximum(units, 0, out=units)
+    np.multiply(cents, rate, out=scratch)
+    np.add(units, scratch, out=units, where=cents >= upper_limit)
+    return units
+
+def _truncate(units, scale, cents):
+    # Every amount here is at least nil, so floor division truncates
+    if _is_scalar(units):
+        return units // scale
+    import numpy as np
+    np.floor_divide(units, scale, out=units)
+    return _like(cents, units)
+
+def _array(cents):
+    if _is_scalar(cents):
+        return cents
+    import numpy as np
+    return np.asarray(cents, dtype=np.int64)
+
+def bracket_tax(schedule, cents):
+    # calc.bracket_tax on a calc.Schedule, in cents
+    return _truncate(_bracket_units(exact_schedule(schedule), _array(cents)), RATE_SCALE, cents)
+
+def offset_amount(offset, cents):
+    return _truncate(_offset_units(exact_offset(offset), _array(cents)), RATE_SCALE, cents)
+
+def medicare_levy(cents, medicare):
+    return _truncate(_medicare_units(exact_medicare(medicare), _array(cents)), RATE_SCALE, cents)
+
+def net_liability(rule, cents):
+    # calc.net_liability in cents: bracket tax less non-refundable offsets,
+    # plus the Medicare levy, truncated once to whole dollars
+    schedule = exact_schedule(rule.schedule)
+    offsets = [exact_offset(offset) for offset in rule.offsets]
+    medicare = exact_medicare(rule.medicare) if rule.medicare else None
+    income = _array(cents)
+
+    if _is_scalar(income):
+        units = _bracket_units(schedule, income)
+        for segments in offsets:
+            units -= _offset_units(segments, income)
+        units = max(units, 0)
+        if medicare:
+            units += _medicare_units(medicare, income)
+        return units // (100 * RATE_SCALE) * 100
+
+    import numpy as np
+
+    # One pass with two scratch arrays, as calc.net_liability does
+    units = _bracket_units(schedule, income)
+    scratch = np.empty_like(income)
+    amount = np.empty_like(income)
+    for segments in offsets:
+        np.subtract(units, _offset_units(segments, income, amount, scratch), out=units)
+    np.maximum(units, 0, out=units)
+    if medicare:
+        np.add(units, _medicare_units(medicare, income, amount, scratch), out=units)
+    np.floor_divide(units, 100 * RATE_SCALE, out=units)
+    np.multiply(units, 100, out=units)
+    return _like(cents, units)
+
+# calc.COLUMNS in cents, under the same names
+EXACT_LIABILITIES = {
+    'prior_tax2024': partial(bracket_tax, PRIOR_2024),
+    'stage3tax2025': partial(bracket_tax, STAGE3_2025),
+    'proposedtax2025': partial(bracket_tax, PROPOSED_2025),
+    'nrtax2025': partial(bracket_tax, NR_2025),
+    'proposed_nrtax2025': partial(bracket_tax, PROPOSED_NR_2025),
+    'hmtax2025': partial(bracket_tax, HM_2025),
+    'proposed_hmtax2025': partial(bracket_tax, PROPOSED_HM_2025),
+    'medicare2025': partial(medicare_levy, medicare=MEDICARE_2025),
+    'proposed_medicare2025': partial(medicare_levy, medicare=PROPOSED_MEDICARE_2025),
+    'lito': partial(offset_amount, LITO),
+    'litmo': partial(offset_amount, LITMO),
+}
+
+EXACT_NET_LIABILITIES = {
+    f"{residency}_{side}": partial(net_liability, rule('2024-25', residency, policy))
+    for residency in COMPARISONS
+    for side, policy in (('current', 'legislated'), ('proposed', 'proposed'))
+}
+
+EXACT_COLUMNS = {**EXACT_LIABILITIES, **EXACT_NET_LIABILITIES}
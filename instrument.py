@@ -0,0 +1,206 @@
+import contextvars
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Timing spans, cache hit/miss counters and per-rerun memory deltas for the
+# Streamlit app, kept per process and exported as Prometheus text or JSON.
+# Off unless TAXCUTS_METRICS is set: span() then hands back one shared no-op
+# context manager and cached() returns the plain cached function, so the
+# disabled cost is a function call and a global lookup.
+
+ENABLED = os.environ.get('TAXCUTS_METRICS', '').lower() in ('1', 'true', 'yes', 'on')
+
+_lock = threading.Lock()
+_spans = {}        # name -> [count, total seconds, max seconds]
+_counters = {}     # (cache, event) -> count
+_lru = {}          # name -> functools.lru_cache function
+_reruns = [0, 0.0, 0]  # reruns, seconds, summed RSS growth in bytes
+_server = None
+
+_NOOP = nullcontext()
+
+# The spans of the rerun running in this thread, if it is being collected
+_current = contextvars.ContextVar('taxcuts_rerun', default=None)
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+
+def span(name):
+    return _Span(name) if ENABLED else _NOOP
+
+def record(name, seconds):
+    with _lock:
+        stats = _spans.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+    spans = _current.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+def count(cache, event, n=1):
+    if ENABLED:
+        with _lock:
+            _counters[cache, event] = _counters.get((cache, event), 0) + n
+
+def cached(name, cache):
+    # Wrap a caching decorator such as st.cache_data so calls and misses are
+    # counted: the inner wrapper only runs when the cache misses.
+    #   @cached('pain_overview', st.cache_data)
+    def decorate(function):
+        if not ENABLED:
+            return cache(function)
+
+        @functools.wraps(function)
+        def miss(*args, **kwargs):
+            count(name, 'miss')
+            return function(*args, **kwargs)
+
+        inner = cache(miss)
+
+        @functools.wraps(function)
+        def call(*args, **kwargs):
+            count(name, 'call')
+            with _Span(name):
+                return inner(*args, **kwargs)
+
+        call.clear = getattr(inner, 'clear', None)
+        return call
+    return decorate
+
+def watch_lru(name, function):
+    # Report a functools.lru_cache function's own hit and miss counts
+    _lru[name] = function
+    return function
+
+def rss_bytes():
+    # Current resident set size; peak size where /proc isn't available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024
+
+class Rerun:
+    def __init__(self):
+        self.spans = []
+        self.seconds = 0.0
+        self.rss_before = rss_bytes()
+        self.rss_after = self.rss_before
+
+    @property
+    def rss_delta(self):
+        return self.rss_after - self.rss_before
+
+@contextmanager
+def rerun():
+    # Collect the spans of one script run and how much it grew the process
+    if not ENABLED:
+        yield None
+        return
+    current = Rerun()
+    token = _current.set(current.spans)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - start
+        current.rss_after = rss_bytes()
+        _current.reset(token)
+        record('rerun', current.seconds)
+        with _lock:
+            _reruns[0] += 1
+            _reruns[1] += current.seconds
+            _reruns[2] += current.rss_delta
+
+def snapshot():
+    with _lock:
+        spans = {name: {'count': c, 'seconds': s, 'max_seconds': m} for name, (c, s, m) in _spans.items()}
+        caches = {}
+        for (cache, event), n in _counters.items():
+            caches.setdefault(cache, {'call': 0, 'miss': 0})[event] = n
+        reruns = {'count': _reruns[0], 'seconds': _reruns[1], 'rss_delta_bytes': _reruns[2]}
+    for cache in caches.values():
+        cache['hit'] = cache['call'] - cache['miss']
+    for name, function in _lru.items():
+        info = function.cache_info()
+        caches[name] = {'call': info.hits + info.misses, 'miss': info.misses, 'hit': info.hits}
+    return {'enabled': ENABLED, 'spans': spans, 'caches': caches, 'reruns': reruns, 'rss_bytes': rss_bytes()}
+
+def prometheus(data=None):
+    data = data or snapshot()
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP taxcuts_{name} {help_text}")
+        lines.append(f"# TYPE taxcuts_{name} {kind}")
+        for labels, value in samples:
+            label = ','.join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"taxcuts_{name}{{{label}}} {value}" if label else f"taxcuts_{name} {value}")
+
+    spans = data['spans']
+    metric('span_seconds_total', 'counter', 'Time spent in each span.',
+           [({'span': n}, s['seconds']) for n, s in spans.items()])
+    metric('span_count_total', 'counter', 'Times each span ran.', [({'span': n}, s['count']) for n, s in spans.items()])
+    metric('span_max_seconds', 'gauge', 'Longest single run of each span.',
+           [({'span': n}, s['max_seconds']) for n, s in spans.items()])
+    metric('cache_hits_total', 'counter', 'Calls answered from cache, by cached function.',
+           [({'cache': n}, c['hit']) for n, c in data['caches'].items()])
+    metric('cache_misses_total', 'counter', 'Calls that had to compute, by cached function.',
+           [({'cache': n}, c['miss']) for n, c in data['caches'].items()])
+    metric('reruns_total', 'counter', 'Script reruns collected.', [({}, data['reruns']['count'])])
+    metric('rerun_rss_delta_bytes_total', 'counter', 'Resident memory growth summed over reruns.',
+           [({}, data['reruns']['rss_delta_bytes'])])
+    metric('rss_bytes', 'gauge', 'Resident memory of the process.', [({}, data['rss_bytes'])])
+    return '\n'.join(lines) + '\n'
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/metrics':
+            body, kind = prometheus().encode(), 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            body, kind = json.dumps(snapshot()).encode(), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', kind)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def serve(port=None, host='127.0.0.1'):
+    # Start the /metrics and /metrics.json endpoint once per process, on
+    # TAXCUTS_METRICS_PORT unless a port is given.  Returns the bound port.
+    global _server
+    with _lock:
+        if _server is None:
+            port = int(port if port is not None else os.environ.get('TAXCUTS_METRICS_PORT', 9464))
+            try:
+                _server = ThreadingHTTPServer((host, port), _Handler)
+            except OSError:
+                # Another process (or an earlier import) already serves this port
+                return None
+            threading.Thread(target=_server.serve_forever, name='taxcuts-metrics', daemon=True).start()
+        return _server.server_address[1]
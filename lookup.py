@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+
+from calc import COLUMNS
+
+# Incomes above this (or with cents) are computed exactly instead of looked up
+CEILING = int(os.environ.get('TAXCUTS_LOOKUP_CEILING', 500_000))
+
+class LiabilityTable:
+    # Every function in COLUMNS at each whole-dollar income from 0 to ceiling,
+    # truncated to the whole dollars main.main() shows.  One int32 row per
+    # income keeps all schedules for a query next to each other in memory.
+    def __init__(self, ceiling=CEILING):
+        self.ceiling = int(ceiling)
+        self.names = tuple(COLUMNS)
+        incomes = np.arange(self.ceiling + 1, dtype=np.float64)
+        self.values = np.empty((self.ceiling + 1, len(self.names)), dtype=np.int32)
+        for j, name in enumerate(self.names):
+            self.values[:, j] = np.trunc(COLUMNS[name](incomes))
+
+    def lookup(self, taxable_income):
+        # {name: int(liability)} for one income, the same as calling each function
+        if 0 <= taxable_income <= self.ceiling and taxable_income == int(taxable_income):
+            return dict(zip(self.names, self.values[int(taxable_income)].tolist()))
+        return {name: int(COLUMNS[name](taxable_income)) for name in self.names}
+
+    def __getitem__(self, key):
+        # table[name, income] for a single value
+        name, taxable_income = key
+        if 0 <= taxable_income <= self.ceiling and taxable_income == int(taxable_income):
+            return int(self.values[int(taxable_income), self.names.index(name)])
+        return int(COLUMNS[name](taxable_income))
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
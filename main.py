@@ -1,14 +1,52 @@
+import os
 import streamlit as st
-import streamlit.components.v1 as components
-import numpy as np
-import time
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
-from calc import *
+from calc import tax_chart
+from charts import load_data, cached_chart, revenue_spec, pain_train_spec, rates_spec, pain_train_curves, rate_curves
+from lookup import LiabilityTable
+import instrument
+from instrument import span
 
 st.set_page_config(page_title = "Stage 3 Tax Simplified", layout = "centered", page_icon=':money_with_wings:')
 
+# 'png' or 'svg' serves charts rendered once per process, 'client' sends the
+# data and lets the browser draw them
+CHARTS = os.environ.get('TAXCUTS_CHARTS', 'png')
+
+# Built once per server process and shared by every session
+@instrument.cached('liability_table', st.cache_resource)
+def liability_table():
+    return LiabilityTable()
+
+# Build it when the script first runs, not on the first click; later reruns
+# are a cache hit
+liability_table()
+
+@instrument.cached('government_receipts', st.cache_data)
+def government_receipts(file_path):
+    return load_data(file_path)
+
+@instrument.cached('pain_overview', st.cache_data)
+def pain_overview():
+    return tax_chart()
+
+@instrument.cached('pain_train', st.cache_data)
+def pain_train():
+    return pain_train_curves()
+
+@instrument.cached('rates', st.cache_data)
+def rates(residency):
+    return rate_curves(residency)
+
+RESIDENCIES = {"Resident": 'resident', "Non Resident": 'non_resident', "Holiday Maker": 'holiday_maker'}
+
+def show_chart(name, df, spec):
+    with span(f"chart:{name}"):
+        if CHARTS == 'client':
+            st.vega_lite_chart(spec(df), use_container_width=True)
+        else:
+            st.image(cached_chart(name, df, CHARTS))
+
 def main():
     st.title("Rethinking Stage 3 Tax Reform: Assessing the Impact")
     with st.container():
@@ -23,39 +61,10 @@ def main():
         st.subheader("Government Revenue received over the last 20 years")
         # Load the CSV file
         file_path = "Government Receipts.csv" 
-        gdf = load_data(file_path) 
-
-        x = gdf['Government Revenue']
-        y = gdf['Total individuals and other withholding']
-        y1 = gdf['Projected']
-                    
-        # Create a figure and axis object
-        fig, ax = plt.subplots()
-
-        # Plot the data
-        ax.plot(x, y1, label='Projected Revenue', color = 'red', linestyle = '--')
-        ax.plot(x, y, label='Government Revenue')
-        
-
-        # Customize the plot
-        ax.set_xlabel('Years')
-        ax.set_ylabel('Dollars')
-        ax.legend()
-        ax.set_yticklabels([])
-        ax.set_xticklabels([])
-
-        # Annotated notes
-        ax.annotate('2008', xy=(2, 125992), xytext=(2, 150000),
-                    arrowprops=dict(facecolor='black', shrink=0.1, width = 0.05, headwidth = 3))
-        ax.annotate('2012', xy=(7, 160203), xytext=(7, 200000),
-            arrowprops=dict(facecolor='black', shrink=0.1, width = 0.05, headwidth = 3))
-        ax.annotate('2018', xy=(14, 228445), xytext=(14, 150000),
-            arrowprops=dict(facecolor='black', shrink=0.1, width = 0.05, headwidth = 3))
-        ax.annotate('We are here', xy=(17, 303200), xytext=(17, 200000),
-            arrowprops=dict(facecolor='black', shrink=0.1, width = 0.05, headwidth = 3))
+        gdf = government_receipts(file_path)
 
         # Display the plot in Streamlit
-        st.pyplot(fig)
+        show_chart('revenue', gdf, revenue_spec)
         st.markdown("""
         Summary of the last 20 years related to income tax:
                                 
@@ -85,134 +94,134 @@ def main():
     
     if st.button('Net effect from the ATO Reaper', key = 'calculations', use_container_width= 500):
         # Calculate tax
-        original = int(stage3tax2025(taxable_income))
-        proposed = int(proposedtax2025(taxable_income))
-        non_resident = int(nrtax2025(taxable_income))
-        proposed_non_resident = int(proposed_nrtax2025(taxable_income))
-        holidaymaker = int(hmtax2025(taxable_income))
-        proposed_holidamaker = int(proposed_hmtax2025(taxable_income))
-        lito2025 = int(lito(taxable_income))
-        lmito2025= int(litmo(taxable_income))
-        medicare = int(medicare2025(taxable_income))
-        proposed_medicare = int(proposed_medicare2025(taxable_income))
-        difference = (original + medicare) - (proposed + proposed_medicare)
-        difference_nr = (non_resident) - (proposed_non_resident)
-        difference_hm = holidaymaker - proposed_holidamaker
+        with span('calculate'):
+            # Tax payable after offsets, Medicare included, each rounded once
+            liabilities = liability_table().lookup(taxable_income)
+            original = liabilities['resident_current']
+            proposed = liabilities['resident_proposed']
+            non_resident = liabilities['non_resident_current']
+            proposed_non_resident = liabilities['non_resident_proposed']
+            holidaymaker = liabilities['holiday_maker_current']
+            proposed_holidamaker = liabilities['holiday_maker_proposed']
+            difference = original - proposed
+            difference_nr = (non_resident) - (proposed_non_resident)
+            difference_hm = holidaymaker - proposed_holidamaker
 
         with st.container():
             st.subheader("Tax cut differences")
         
         color = 'green' if difference >=0 else 'red'
 
-        if user_type == "Resident":
+        with span('markdown'):
+            if user_type == "Resident":
 
-            with st.container():
-                st.markdown("""
-                <style>
-                    .st-curve {
-                        border-radius: 10px;
-                        border: 1px solid #8E9DCC;
-                        padding: 10px;
-                        box-shadow: 5px 5px 15px rgba(0, 0, 0, 0.2);
-                        font-size: 16px;
-                    }
-                </style>
-                """, unsafe_allow_html = True)
-                st.markdown(f"""
-                    <div class="st-curve">
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
-                            <div></div>
-                            <div></div>
-                        </div>
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
-                            <div>Tax Liability including the Medicare levy (Liberal)</div>
-                            <div>${original+medicare:,}</div>
+                with st.container():
+                    st.markdown("""
+                    <style>
+                        .st-curve {
+                            border-radius: 10px;
+                            border: 1px solid #8E9DCC;
+                            padding: 10px;
+                            box-shadow: 5px 5px 15px rgba(0, 0, 0, 0.2);
+                            font-size: 16px;
+                        }
+                    </style>
+                    """, unsafe_allow_html = True)
+                    st.markdown(f"""
+                        <div class="st-curve">
+                            <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                                <div></div>
+                                <div></div>
+                            </div>
+                            <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                                <div>Tax Liability after offsets, including the Medicare levy (Liberal)</div>
+                                <div>${original:,}</div>
+                            </div>
+                            <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                                <div>Revised Tax Liability after offsets, including the proposed changes to the Medicare levy (Labor)</div>
+                                <div>${proposed:,}</div>
+                            </div>
+                            <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                                <div style="color: {color}">Difference ({"Better off" if difference >= 0 else "Worse off"})</div>
+                                <div style="color : {'green' if  difference >= 0 else 'red'}">${abs(difference):,}
+                            </div>
                         </div>
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
-                            <div>Revised Tax Liability including the proposed changes to the Medicare levy (Labor)</div>
-                            <div>${proposed+proposed_medicare:,}</div>
-                        </div>
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
-                            <div style="color: {color}">Difference ({"Better off" if difference >= 0 else "Worse off"})</div>
-                            <div style="color : {'green' if  difference >= 0 else 'red'}">${abs(difference):,}
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
+                        """, unsafe_allow_html=True)
 
-        elif user_type == "Non Resident":
+            elif user_type == "Non Resident":
             
-            with st.container():
-                st.markdown("""
-                <style>
-                    .st-curve {
-                        border-radius: 10px;
-                        border: 1px solid #8E9DCC;
-                        padding: 10px;
-                        box-shadow: 5px 5px 15px rgba(0, 0, 0, 0.2);
-                        font-size: 16px;
-                    }
-                </style>
-                """, unsafe_allow_html = True)
-                st.markdown(f"""
-                    <div class="st-curve">
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
-                            <div></div>
-                            <div></div>
-                        </div>
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
-                            <div>Tax Liability (Liberal)</div>
-                            <div>${non_resident:,}</div>
-                        </div>
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
-                            <div>Revised Tax Liability (Labor)</div>
-                            <div>${proposed_non_resident:,}</div>
+                with st.container():
+                    st.markdown("""
+                    <style>
+                        .st-curve {
+                            border-radius: 10px;
+                            border: 1px solid #8E9DCC;
+                            padding: 10px;
+                            box-shadow: 5px 5px 15px rgba(0, 0, 0, 0.2);
+                            font-size: 16px;
+                        }
+                    </style>
+                    """, unsafe_allow_html = True)
+                    st.markdown(f"""
+                        <div class="st-curve">
+                            <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                                <div></div>
+                                <div></div>
+                            </div>
+                            <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                                <div>Tax Liability (Liberal)</div>
+                                <div>${non_resident:,}</div>
+                            </div>
+                            <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                                <div>Revised Tax Liability (Labor)</div>
+                                <div>${proposed_non_resident:,}</div>
+                            </div>
+                            <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                                <div style="color: {color}">Difference ({"Better off" if difference_nr >= 0 else "Worse off"})</div>
+                                <div style="color : {'green' if  difference_nr >= 0 else 'red'}">${abs(difference_nr):,}
+                            </div>
                         </div>
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
-                            <div style="color: {color}">Difference ({"Better off" if difference_nr >= 0 else "Worse off"})</div>
-                            <div style="color : {'green' if  difference_nr >= 0 else 'red'}">${abs(difference_nr):,}
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
+                        """, unsafe_allow_html=True)
         
-        else:
+            else:
             
-            with st.container():
-                st.markdown("""
-                <style>
-                    .st-curve {
-                        border-radius: 10px;
-                        border: 1px solid #8E9DCC;
-                        padding: 10px;
-                        box-shadow: 5px 5px 15px rgba(0, 0, 0, 0.2);
-                        font-size: 16px;
-                    }
-                </style>
-                """, unsafe_allow_html = True)
-                st.markdown(f"""
-                    <div class="st-curve">
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
-                            <div></div>
-                            <div></div>
-                        </div>
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
-                            <div>Tax Liability (Liberal)</div>
-                            <div>${holidaymaker:,}</div>
-                        </div>
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
-                            <div>Revised Tax Liability (Labor)</div>
-                            <div>${proposed_holidamaker:,}</div>
+                with st.container():
+                    st.markdown("""
+                    <style>
+                        .st-curve {
+                            border-radius: 10px;
+                            border: 1px solid #8E9DCC;
+                            padding: 10px;
+                            box-shadow: 5px 5px 15px rgba(0, 0, 0, 0.2);
+                            font-size: 16px;
+                        }
+                    </style>
+                    """, unsafe_allow_html = True)
+                    st.markdown(f"""
+                        <div class="st-curve">
+                            <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                                <div></div>
+                                <div></div>
+                            </div>
+                            <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                                <div>Tax Liability (Liberal)</div>
+                                <div>${holidaymaker:,}</div>
+                            </div>
+                            <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                                <div>Revised Tax Liability (Labor)</div>
+                                <div>${proposed_holidamaker:,}</div>
+                            </div>
+                            <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                                <div style="color: {color}">Difference ({"Better off" if difference_hm >= 0 else "Worse off"})</div>
+                                <div style="color : {'green' if  difference_hm >= 0 else 'red'}">${abs(difference_hm):,}
+                            </div>
                         </div>
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
-                            <div style="color: {color}">Difference ({"Better off" if difference_hm >= 0 else "Worse off"})</div>
-                            <div style="color : {'green' if  difference_hm >= 0 else 'red'}">${abs(difference_hm):,}
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
+                        """, unsafe_allow_html=True)
 
         st.text("")
         st.subheader("Pain overview:")           
         st.text("")                 
-        taxable_income_range, prior_liability, tax_liability, proposed_tax_liability = tax_chart()
+        taxable_income_range, prior_liability, tax_liability, proposed_tax_liability = pain_overview()
                 
         data = {'Taxable Income': taxable_income_range,
                 'Current Tax Rates (2024)': prior_liability,
@@ -225,20 +234,12 @@ def main():
         st.text("")
         st.subheader("Pain Train:")           
         st.text("")
-        fig, ax = plt.subplots()
-        # st.line_chart(df.set_index('Taxable Income'), x='Taxablele Income')
-        ax.plot(df['Taxable Income'], df['Current Tax Rates (2024)'], label='Current Tax Rates (2024)')
-        ax.plot(df['Taxable Income'], df['Stage 3 Tax Cuts (Liberal)'], label='Stage 3 Tax Cuts (Liberal)')
-        ax.plot(df['Taxable Income'], df['Proposed Stage 3 Tax Cuts (Labor)'], label='Proposed Stage 3 Tax Cuts (Labor)')
-
-        # Customize the plot
-        ax.set_xlabel('Taxable Income')
-        ax.set_ylabel('Tax Liability')
-        ax.set_title('Tax Liability Comparison')
-        ax.legend()
-
-        # Display the plot using st.pyplot
-        st.pyplot(fig)
+        # Display the plot, drawn through the exact vertices of each schedule
+        show_chart('pain_train', pain_train(), pain_train_spec)
+        st.text("")
+        st.subheader("Marginal and effective rates:")
+        st.text("")
+        show_chart('rates', rates(RESIDENCIES[user_type]), rates_spec)
         # st.text("")
         # st.markdown("""
         # **Revised calculation** - Changes in Lmito and Lito to provide the same results:
@@ -288,5 +289,30 @@ def main():
             With the current proposal, the short term benefit may not help in realising better outcomes as people that are better off have more opportunities available to them in reducing thier overall tax liability.  The Tradie next door earning over 190k is more incentivised into organising a business structure now because they will have notionally saved 19(%) off thier tax bill.
             """)
 
+def debug_sidebar(rerun):
+    # Opt in with ?debug=1 on the URL; needs TAXCUTS_METRICS set to collect anything
+    if st.query_params.get('debug') != '1':
+        return
+    with st.sidebar:
+        st.subheader("Debug")
+        if rerun is None:
+            st.text("Set TAXCUTS_METRICS=1 to collect timings.")
+            return
+        st.text(f"This rerun: {rerun.seconds * 1000:,.1f} ms, memory {rerun.rss_delta / 2**20:+,.1f} MB")
+        spans = {}
+        for name, seconds in rerun.spans:
+            spans[name] = spans.get(name, 0.0) + seconds * 1000
+        st.dataframe(pd.DataFrame({'Stage': list(spans), 'ms': list(spans.values())}), hide_index=True)
+        caches = instrument.snapshot()['caches']
+        st.dataframe(pd.DataFrame([{'Cache': name, **counts} for name, counts in caches.items()]), hide_index=True)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if instrument.ENABLED:
+        from calc import load_rules
+        from piecewise import liability
+        instrument.watch_lru('load_rules', load_rules)
+        instrument.watch_lru('piecewise.liability', liability)
+        instrument.serve()
+    with instrument.rerun() as rerun:
+        main()
+    debug_sidebar(rerun)
\ No newline at end of file
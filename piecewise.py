@@ -0,0 +1,317 @@
+from functools import lru_cache
+
+import numpy as np
+
+class PiecewiseLinear:
+    # A function of taxable income made of straight pieces.  breaks holds the
+    # n - 1 finite points where the pieces meet, piece k runs from breaks[k - 1]
+    # to breaks[k] (open ended at either side) and is c[k] + m[k] * income on it.
+    # Jumps are allowed between pieces; at a break the piece to the right is used,
+    # so a value reached only just past a jump is solved to the jump itself.
+    def __init__(self, breaks, c, m):
+        self.breaks = np.asarray(breaks, dtype=np.float64)
+        self.c = np.asarray(c, dtype=np.float64)
+        self.m = np.asarray(m, dtype=np.float64)
+
+    @classmethod
+    def constant(cls, value):
+        return cls([], [value], [0.0])
+
+    @classmethod
+    def identity(cls):
+        return cls([], [0.0], [1.0])
+
+    @property
+    def lowers(self):
+        return np.concatenate(([-np.inf], self.breaks))
+
+    @property
+    def uppers(self):
+        return np.concatenate((self.breaks, [np.inf]))
+
+    def __call__(self, taxable_income):
+        k = np.searchsorted(self.breaks, taxable_income, side='right')
+        value = self.c[k] + self.m[k] * taxable_income
+        return float(value) if np.ndim(value) == 0 else value
+
+    def _pieces_at(self, breaks):
+        # Index of this function's piece on each interval between the given breaks
+        if len(breaks) == 0:
+            return np.zeros(1, dtype=np.intp)
+        midpoints = np.concatenate(([breaks[0] - 1], (breaks[:-1] + breaks[1:]) / 2, [breaks[-1] + 1]))
+        return np.searchsorted(self.breaks, midpoints, side='right')
+
+    def _combine(self, other, sign):
+        if not isinstance(other, PiecewiseLinear):
+            other = PiecewiseLinear.constant(other)
+        breaks = np.union1d(self.breaks, other.breaks)
+        i, j = self._pieces_at(breaks), other._pieces_at(breaks)
+        return PiecewiseLinear(breaks, self.c[i] + sign * other.c[j], self.m[i] + sign * other.m[j]).simplify()
+
+    def __add__(self, other):
+        return self._combine(other, 1.0)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self._combine(other, -1.0)
+
+    def __rsub__(self, other):
+        return PiecewiseLinear(self.breaks, -self.c, -self.m) + other
+
+    def maximum(self, other):
+        return self._select(other, np.greater_equal)
+
+    def minimum(self, other):
+        return self._select(other, np.less_equal)
+
+    def _select(self, other, keep_self):
+        # Pointwise max/min: split every piece where the two lines cross, then
+        # keep whichever side wins on each part
+        if not isinstance(other, PiecewiseLinear):
+            other = PiecewiseLinear.constant(other)
+        breaks = np.union1d(self.breaks, other.breaks)
+        i, j = self._pieces_at(breaks), other._pieces_at(breaks)
+        lowers = np.concatenate(([-np.inf], breaks))
+        uppers = np.concatenate((breaks, [np.inf]))
+        dc = self.c[i] - other.c[j]
+        dm = self.m[i] - other.m[j]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cross = -dc / dm
+        crossing = (dm != 0) & (cross > lowers) & (cross < uppers)
+        breaks = np.union1d(breaks, cross[crossing])
+        i, j = self._pieces_at(breaks), other._pieces_at(breaks)
+
+        # Compare the two lines at the middle of each new piece
+        if len(breaks):
+            midpoints = np.concatenate(([breaks[0] - 1], (breaks[:-1] + breaks[1:]) / 2, [breaks[-1] + 1]))
+        else:
+            midpoints = np.zeros(1)
+        mine = keep_self(self.c[i] + self.m[i] * midpoints, other.c[j] + other.m[j] * midpoints)
+        return PiecewiseLinear(breaks, np.where(mine, self.c[i], other.c[j]),
+                               np.where(mine, self.m[i], other.m[j])).simplify()
+
+    def simplify(self):
+        # Drop breaks between two pieces on the same line
+        same = (self.c[1:] == self.c[:-1]) & (self.m[1:] == self.m[:-1])
+        if not same.any():
+            return self
+        keep = np.concatenate(([True], ~same))
+        return PiecewiseLinear(self.breaks[~same], self.c[keep], self.m[keep])
+
+    def at_scale(self, factor):
+        # The function of income x that gives this function at factor * x
+        return PiecewiseLinear(self.breaks / factor, self.c, self.m * factor)
+
+    def vertices(self, lower, upper):
+        # The exact polyline of the function between lower and upper: the two
+        # ends and every break in between, with a jump drawn as two points at
+        # the same income (the value from the left, then the value at it)
+        inner = self.breaks[(self.breaks > lower) & (self.breaks < upper)]
+        k = np.searchsorted(self.breaks, inner, side='right')
+        left = self.c[k - 1] + self.m[k - 1] * inner
+        right = self.c[k] + self.m[k] * inner
+        jump = np.abs(left - right) > 1e-9 * np.maximum(1.0, np.abs(right))
+        x = np.concatenate(([lower], np.repeat(inner, np.where(jump, 2, 1)), [upper]))
+        y = np.empty_like(x)
+        y[0], y[-1] = self(lower), self(upper)
+        # For each break the left value goes first; where there is no jump it
+        # is the only point
+        at = 1 + np.concatenate(([0], np.cumsum(np.where(jump, 2, 1))[:-1])).astype(np.intp)
+        y[at] = left
+        y[at[jump] + 1] = right[jump]
+        return x, y
+
+    def marginal_rate(self):
+        # The slope of each piece, as a step function
+        return PiecewiseLinear(self.breaks, self.m, np.zeros_like(self.m)).simplify()
+
+    def effective_rate(self, taxable_income):
+        # function / income, nan at nil income
+        x = np.asarray(taxable_income, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = np.where(x > 0, self(x) / x, np.nan)
+        return float(rate) if np.ndim(rate) == 0 else rate
+
+    def effective_rate_vertices(self, lower, upper, tolerance=1e-4):
+        # Polyline of function / income between lower and upper.  On a piece
+        # the rate is m + c / income, a hyperbola, so each piece gets points
+        # spaced geometrically just close enough that straight lines between
+        # them stay within tolerance of it (about 0.01 percentage points by
+        # default); pieces through the origin are flat and need only their ends.
+        lower = max(lower, 1.0)
+        edges = np.concatenate(([lower], self.breaks[(self.breaks > lower) & (self.breaks < upper)], [upper]))
+        xs = []
+        for a, b in zip(edges[:-1], edges[1:]):
+            c = self.c[np.searchsorted(self.breaks, (a + b) / 2, side='right')]
+            # The chord of c / x over [a, r * a] is off by at most |c| / a * (r - 1)^2 / 4
+            points = 1
+            if c != 0:
+                ratio = 1 + np.sqrt(4 * tolerance * a / abs(c))
+                points = max(1, int(np.ceil(np.log(b / a) / np.log(ratio))))
+            xs.append(np.geomspace(a, b, points + 1)[:-1])
+        x = np.concatenate(xs + [[upper]])
+        # Both sides of each jump, as in vertices
+        k = np.searchsorted(self.breaks, x, side='right')
+        at_break = np.isin(x, self.breaks) & (k > 0)
+        left = np.where(at_break, self.c[k - 1] + self.m[k - 1] * x, np.nan) / x
+        y = self.effective_rate(x)
+        jump = at_break & (np.abs(left - y) > 1e-12)
+        x = np.repeat(x, np.where(jump, 2, 1))
+        y = np.repeat(y, np.where(jump, 2, 1))
+        first = np.concatenate(([0], np.cumsum(np.where(jump, 2, 1))[:-1]))[jump]
+        y[first] = left[jump]
+        return x, y
+
+    def _anchors(self):
+        # Each piece's left break (the first piece uses its right one) and the
+        # running integral from breaks[0] up to it
+        if len(self.breaks) == 0:
+            return np.zeros(1), np.zeros(1)
+        anchors = np.concatenate((self.breaks[:1], self.breaks))
+        widths = np.diff(self.breaks)
+        inner = widths * (self.c[1:-1] + self.m[1:-1] * (self.breaks[1:] + self.breaks[:-1]) / 2)
+        return anchors, np.concatenate(([0.0, 0.0], np.cumsum(inner)))
+
+    def antiderivative(self, taxable_income):
+        # Integral of the function from breaks[0] (or 0) to taxable_income
+        anchors, areas = self._anchors()
+        x = np.asarray(taxable_income, dtype=np.float64)
+        k = np.searchsorted(self.breaks, x, side='right')
+        a = anchors[k]
+        return areas[k] + (x - a) * (self.c[k] + self.m[k] * (x + a) / 2)
+
+    def integral(self, lower, upper):
+        # Exact area under the function between lower and upper
+        return self.antiderivative(upper) - self.antiderivative(lower)
+
+    def solve(self, target, side='lowest', floor=0.0):
+        # Income at or above floor where the function equals target, straight
+        # from each piece's line.  side='highest' gives the largest such income
+        # instead; flat pieces answer with their end.  nan when nothing matches.
+        return _solve(self.lowers, self.uppers, self.c, self.m, target, side, floor)
+
+    def solve_ratio(self, target, side='lowest', floor=0.0):
+        # Income where function / income equals target, e.g. an effective rate.
+        # On a piece c + m * x = t * x, so x = c / (t - m).
+        return _solve(self.lowers, self.uppers, self.c, self.m, target, side, floor, ratio=True)
+
+def _solve(lowers, uppers, c, m, target, side, floor, ratio=False):
+    t = np.asarray(target, dtype=np.float64)[..., None]
+    slope = m - t if ratio else m
+    offset = c if ratio else c - t
+    lowers = np.maximum(lowers, floor)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = -offset / slope
+
+    tolerance = 1e-9 * np.maximum(1.0, np.abs(x))
+    found = (slope != 0) & (x >= lowers - tolerance) & (x <= uppers + tolerance)
+    if ratio:
+        # every line through the origin has the target ratio at 0, skip it
+        found &= x > 0
+    x = np.clip(x, lowers, uppers)
+
+    # A flat piece sitting on the target matches along its whole length
+    flat = (slope == 0) & (np.abs(offset) <= 1e-9 * np.maximum(1.0, np.abs(t))) & (lowers <= uppers)
+    if side == 'lowest':
+        x = np.where(flat, lowers, x)
+        x = np.where(found | flat, x, np.inf).min(axis=-1)
+    else:
+        x = np.where(flat, uppers, x)
+        x = np.where(found | flat, x, -np.inf).max(axis=-1)
+    x = np.where((found | flat).any(axis=-1), x, np.nan)
+    return float(x) if np.ndim(target) == 0 else x
+
+@lru_cache(maxsize=None)
+def from_schedule(schedule):
+    # Bracket tax: nothing below the first bracket, each bracket's rate on its
+    # own span, and flat across any gap before the next bracket starts
+    breaks, c, m = [], [0.0], [0.0]
+    for lower, upper, rate, base in zip(*schedule):
+        breaks.append(lower)
+        c.append(base - rate * lower)
+        m.append(rate)
+        if upper == np.inf:
+            break
+        breaks.append(upper)
+        c.append(base + (upper - lower) * rate)
+        m.append(0.0)
+    return PiecewiseLinear(breaks, c, m).simplify()
+
+@lru_cache(maxsize=None)
+def from_medicare(medicare):
+    lower_limit, upper_limit, shade_in_rate, rate = medicare
+    return PiecewiseLinear([lower_limit, upper_limit],
+                           [0.0, -lower_limit * shade_in_rate, -lower_limit * shade_in_rate],
+                           [0.0, shade_in_rate, shade_in_rate + rate])
+
+@lru_cache(maxsize=None)
+def from_offset(offset):
+    # Cut the income line at every segment bound and give each interval the
+    # first segment covering it, then apply that segment's cap and the floor at 0.
+    # Segments are closed but pieces are right-continuous, so a segment ends
+    # at a break just past its upper bound and still holds at the bound itself.
+    ends = [(segment.lower, np.nextafter(segment.upper, np.inf)) for segment in offset.segments]
+    bounds = sorted({b for end in ends for b in end if np.isfinite(b)})
+    result = PiecewiseLinear.constant(0.0)
+    breaks = np.asarray(bounds, dtype=np.float64)
+    lowers = np.concatenate(([-np.inf], breaks))
+    uppers = np.concatenate((breaks, [np.inf]))
+    for lower, upper in zip(lowers, uppers):
+        for segment, (start, end) in zip(offset.segments, ends):
+            if start <= lower and upper <= end:
+                line = PiecewiseLinear([], [segment.amount - segment.taper * segment.start], [segment.taper])
+                line = line.minimum(segment.cap) if np.isfinite(segment.cap) else line
+                result = result + _window(line, lower, upper)
+                break
+    return result.maximum(0.0)
+
+def _window(line, lower, upper):
+    # line between lower and upper, zero elsewhere
+    breaks = np.union1d(line.breaks[(line.breaks > lower) & (line.breaks < upper)],
+                        [b for b in (lower, upper) if np.isfinite(b)])
+    k = line._pieces_at(breaks)
+    inside = (np.concatenate(([-np.inf], breaks)) >= lower) & (np.concatenate((breaks, [np.inf])) <= upper)
+    return PiecewiseLinear(breaks, np.where(inside, line.c[k], 0.0), np.where(inside, line.m[k], 0.0))
+
+@lru_cache(maxsize=None)
+def liability(rule):
+    # Bracket tax less the rule's offsets (never below nil, they are not
+    # refundable) plus the Medicare levy
+    return _liability(rule, from_schedule, from_medicare)
+
+def fresh_liability(rule):
+    # liability() for a rule made on the fly, such as a what-if or indexed
+    # variant, built without adding its schedule or Medicare thresholds to any
+    # cache, where a long-lived process would keep them for good.  Offsets
+    # come unchanged from rules.json, so theirs stay cached.
+    return _liability(rule, from_schedule.__wrapped__, from_medicare.__wrapped__)
+
+def _liability(rule, schedule_form, medicare_form):
+    total = schedule_form(rule.schedule)
+    for offset in rule.offsets:
+        total = total - from_offset(offset)
+    total = total.maximum(0.0)
+    if rule.medicare:
+        total = total + medicare_form(rule.medicare)
+    return total
+
+@lru_cache(maxsize=None)
+def net_pay(rule):
+    # Taxable income less liability(rule)
+    return PiecewiseLinear.identity() - liability(rule)
+
+def income_for_tax(schedule, target, side='lowest'):
+    return from_schedule(schedule).solve(target, side)
+
+def income_for_offset(offset, target, side='lowest'):
+    return from_offset(offset).solve(target, side)
+
+def income_for_liability(rule, target, side='lowest'):
+    return liability(rule).solve(target, side)
+
+def income_for_net_pay(rule, target, side='lowest'):
+    return net_pay(rule).solve(target, side)
+
+def income_for_effective_rate(rule, target, side='lowest'):
+    return liability(rule).solve_ratio(target, side)
@@ -0,0 +1,153 @@
+import argparse
+import json
+import math
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from calc import COMPARISONS, make_schedule, rule
+from charts import load_data
+from piecewise import fresh_liability
+from whatif import IncomeStats
+
+# Rolls a population forward a year at a time and totals tax under each
+# scenario: a policy (legislated or proposed Stage 3) and a bracket
+# indexation rate, 0 meaning thresholds stay put and wage growth pushes
+# people up the brackets.  Every income grows by the same wage growth, so a
+# year's liability is the base year's piecewise liability with its breaks
+# moved down by the cumulative growth.  The population is sorted once and
+# each year of each scenario is then a few binary searches per piece, with
+# no row touched again.  Medicare thresholds are indexed with the brackets;
+# offsets are fixed amounts in law and are not.
+
+BASE_YEAR = '2024-25'
+RECEIPTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Government Receipts.csv')
+
+Scenario = namedtuple('Scenario', ['policy', 'indexation'])
+
+def year_label(base, offset):
+    # '2024-25' moved on by offset years
+    start = int(base[:4]) + offset
+    return f"{start}-{(start + 1) % 100:02d}"
+
+def indexed(entry, factor):
+    # entry with its bracket and Medicare thresholds scaled by factor and
+    # rounded to whole dollars, each bracket still starting $1 above the last
+    if factor == 1:
+        return entry
+    schedule = entry.schedule
+    uppers = [round(upper * factor) if math.isfinite(upper) else upper for upper in schedule.uppers]
+    lowers = [schedule.lowers[0]] + [upper + 1 for upper in uppers[:-1]]
+    entry = entry._replace(schedule=make_schedule(list(zip(lowers, uppers)), schedule.rates))
+    if entry.medicare:
+        entry = entry._replace(medicare=entry.medicare._replace(
+            lower_limit=round(entry.medicare.lower_limit * factor),
+            upper_limit=round(entry.medicare.upper_limit * factor)))
+    return entry
+
+class Projection:
+    def __init__(self, incomes_by_residency, base_year=BASE_YEAR):
+        # incomes_by_residency maps each residency to its base year incomes
+        self.base_year = base_year
+        self.stats = {residency: IncomeStats(incomes) for residency, incomes in incomes_by_residency.items()}
+
+    def revenue(self, scenario, years, wage_growth, population_growth=0.0):
+        # Total liability for each of years years, in dollars
+        results = []
+        for offset in range(years):
+            wages = (1 + wage_growth) ** offset
+            index = (1 + scenario.indexation) ** offset
+            people = (1 + population_growth) ** offset
+            total = 0.0
+            taxpayers = 0
+            for residency, stats in self.stats.items():
+                entry = indexed(rule(self.base_year, residency, scenario.policy), index)
+                total += stats.total(fresh_liability(entry).at_scale(wages)) * people
+                taxpayers += len(stats.incomes) * people
+            results.append({'year': year_label(self.base_year, offset), 'revenue': total, 'taxpayers': taxpayers})
+        return results
+
+def reconcile(results, receipts, scale):
+    # Scaled model revenue against the budget's Projected column, in $m
+    projected = {label.split(' ')[0]: value for label, value in zip(receipts['Government Revenue'], receipts['Projected'])}
+    rows = []
+    for result in results:
+        if result['year'] not in projected:
+            continue
+        model = result['revenue'] * scale / 1e6
+        target = float(projected[result['year']])
+        rows.append({'year': result['year'], 'projected_m': target, 'model_m': model,
+                     'gap_m': model - target, 'gap_pct': 100 * (model - target) / target})
+    return rows
+
+def synthetic_incomes(taxpayers, seed=0):
+    # Base year incomes per residency from simulate.py's default population
+    from simulate import DEFAULT_POPULATION, draw_incomes
+
+    rng = np.random.default_rng(seed)
+    mix = DEFAULT_POPULATION.residency_mix
+    shares = np.array([mix.get(r, 0.0) for r in COMPARISONS])
+    counts = rng.multinomial(taxpayers, shares / shares.sum())
+    return {residency: draw_incomes(rng, count, DEFAULT_POPULATION) for residency, count in zip(COMPARISONS, counts)}
+
+def file_incomes(path, column, residency_column=None):
+    import pandas as pd
+
+    columns = [column] + ([residency_column] if residency_column else [])
+    df = pd.read_parquet(path, columns=columns) if path.lower().endswith(('.parquet', '.pq')) else pd.read_csv(path, usecols=columns)
+    incomes = pd.to_numeric(df[column], errors='coerce')
+    if not residency_column:
+        return {'resident': incomes.dropna().to_numpy()}
+    return {residency: incomes[df[residency_column] == residency].dropna().to_numpy() for residency in COMPARISONS}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Project income tax revenue forward under each Stage 3 variant '
+                                                 'and reconcile it with the Projected receipts.')
+    parser.add_argument('--input', help='CSV or Parquet of base year incomes; a synthetic population if left out')
+    parser.add_argument('--column', default='taxable_income')
+    parser.add_argument('--residency-column', help='column naming each row resident, non_resident or holiday_maker')
+    parser.add_argument('--taxpayers', type=float, default=10_000_000, help='synthetic population size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--wage-growth', type=float, default=0.035)
+    parser.add_argument('--population-growth', type=float, default=0.015)
+    parser.add_argument('--policies', default='legislated,proposed')
+    parser.add_argument('--indexation', default='0,0.025', help='bracket indexation rates, comma separated')
+    parser.add_argument('--calibrate-to', default='proposed',
+                        help='scenario policy whose base year revenue is scaled to the Projected receipts')
+    parser.add_argument('--receipts', default=RECEIPTS_FILE)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.input:
+        incomes = file_incomes(args.input, args.column, args.residency_column)
+    else:
+        incomes = synthetic_incomes(int(args.taxpayers), args.seed)
+    projection = Projection(incomes)
+    loaded = time.perf_counter() - start
+
+    scenarios = [Scenario(policy, float(rate)) for policy in args.policies.split(',')
+                 for rate in args.indexation.split(',')]
+    results = {scenario: projection.revenue(scenario, args.years, args.wage_growth, args.population_growth)
+               for scenario in scenarios}
+
+    # One scale for every scenario, taking the model population to the
+    # national total in the base year, so scenarios stay comparable
+    receipts = load_data(args.receipts)
+    anchor = reconcile(results[Scenario(args.calibrate_to, 0.0)][:1], receipts, 1.0)
+    scale = anchor[0]['projected_m'] / anchor[0]['model_m'] if anchor else 1.0
+
+    report = {'scale': scale, 'scenarios': {}}
+    for scenario, result in results.items():
+        name = f"{scenario.policy}/indexed {scenario.indexation:g}"
+        report['scenarios'][name] = {
+            'revenue_m': {r['year']: r['revenue'] * scale / 1e6 for r in result},
+            'reconciliation': reconcile(result, receipts, scale),
+        }
+    report['seconds'] = {'load': loaded, 'project': time.perf_counter() - start - loaded}
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
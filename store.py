@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+
+from calc import COLUMNS, RULES
+
+# Scored populations kept on disk so dashboards and later batch runs can open
+# them instead of scoring again.  An entry is a directory of uncompressed Arrow
+# IPC part files, memory-mapped on read so every process shares the same pages
+# of OS cache, plus a meta.json written last that marks the entry complete.
+# Entries are named by a hash of the input file and a hash of the compiled
+# rules, so changing any schedule in rules.json makes every old entry a miss,
+# and prune() removes them.
+#
+# Each part holds the income as given (float64) and every column in
+# calc.COLUMNS truncated to whole dollars as int32, the same figures the app
+# shows and the lookup table holds, at half the size of the float scores.
+
+FORMAT = 1
+STORE_DIR = os.environ.get('TAXCUTS_STORE', os.path.join(os.path.expanduser('~'), '.cache', 'taxcuts'))
+
+def rules_version():
+    # Hash of exactly what this process scores with: the store format, the
+    # columns and the compiled rules, so a stale process never labels its
+    # results with newer rules
+    return hashlib.sha256(repr((FORMAT, tuple(COLUMNS), RULES)).encode()).hexdigest()[:16]
+
+def input_hash(path, column, exact=False):
+    # exact scores (batch.py --exact) are kept apart from float ones
+    digest = hashlib.sha256(column.encode() + (b'/exact' if exact else b''))
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:32]
+
+def entry_path(digest, store_dir=STORE_DIR):
+    return os.path.join(store_dir, f"{digest}-{rules_version()}")
+
+def to_part(scored, column):
+    # One scored chunk (as batch.score_chunk makes it) as an Arrow record batch,
+    # with an income that couldn't be read stored as nan, as it was scored
+    import pandas as pd
+    arrays = {column: pa.array(pd.to_numeric(scored[column], errors='coerce').to_numpy(np.float64))}
+    for name in COLUMNS:
+        dollars = np.trunc(np.nan_to_num(scored[name].to_numpy(np.float64)))
+        if len(dollars) and (dollars.min() < np.iinfo(np.int32).min or dollars.max() > np.iinfo(np.int32).max):
+            raise ValueError(f"{name} does not fit the store's int32 dollars")
+        arrays[name] = pa.array(dollars.astype(np.int32))
+    return pa.RecordBatch.from_pydict(arrays)
+
+class PartWriter:
+    # Appends scored chunks to one Arrow IPC part file
+    def __init__(self, path, column):
+        self.path = path
+        self.column = column
+        self.writer = None
+
+    def write(self, scored):
+        batch = to_part(scored, self.column)
+        if self.writer is None:
+            self.writer = pa.ipc.new_file(self.path, batch.schema)
+        self.writer.write_batch(batch)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def begin(store_dir=STORE_DIR):
+    # A scratch directory for a new entry's parts, inside the store so that
+    # commit() is a rename on the same filesystem
+    os.makedirs(store_dir, exist_ok=True)
+    building = tempfile.mkdtemp(prefix='.building-', dir=store_dir)
+    # Readable by other users' processes, like the files inside it
+    os.chmod(building, 0o755)
+    return building
+
+def commit(building, digest, input_path, column, summary, store_dir=STORE_DIR):
+    # Write meta.json and move the parts into place under the input's hash.
+    # If another process got there first its entry is kept and ours dropped.
+    meta = {'format': FORMAT, 'rules': rules_version(), 'input': os.path.abspath(input_path),
+            'input_hash': digest, 'column': column, 'summary': summary}
+    with open(os.path.join(building, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    path = entry_path(digest, store_dir)
+    try:
+        os.rename(building, path)
+    except OSError:
+        shutil.rmtree(building, ignore_errors=True)
+    prune(store_dir)
+    return path
+
+def read_meta(path):
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def open_entry(path):
+    # Every part memory-mapped and joined without copying
+    parts = sorted(name for name in os.listdir(path) if name.endswith('.arrow'))
+    tables = [pa.ipc.open_file(pa.memory_map(os.path.join(path, name))).read_all() for name in parts]
+    return pa.concat_tables(tables) if tables else None
+
+def load(digest, store_dir=STORE_DIR):
+    # (table, meta) of the current entry for an input_hash(), or None
+    path = entry_path(digest, store_dir)
+    meta = read_meta(path)
+    if meta is None or meta['format'] != FORMAT or meta['rules'] != rules_version():
+        return None
+    return open_entry(path), meta
+
+def entries(store_dir=STORE_DIR):
+    # Complete entries scored under the current rules, as (path, meta)
+    if not os.path.isdir(store_dir):
+        return []
+    found = []
+    for name in sorted(os.listdir(store_dir)):
+        meta = read_meta(os.path.join(store_dir, name))
+        if meta is not None and meta['format'] == FORMAT and meta['rules'] == rules_version():
+            found.append((os.path.join(store_dir, name), meta))
+    return found
+
+def prune(store_dir=STORE_DIR):
+    # Remove entries scored under other rules or formats.  Unfinished builds
+    # are left alone, they may belong to a run still in progress.
+    if not os.path.isdir(store_dir):
+        return
+    version = rules_version()
+    for name in os.listdir(store_dir):
+        path = os.path.join(store_dir, name)
+        if name.startswith('.') or not os.path.isdir(path):
+            continue
+        meta = read_meta(path)
+        if meta is None or meta['format'] != FORMAT or meta['rules'] != version:
+            shutil.rmtree(path, ignore_errors=True)
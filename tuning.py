@@ -0,0 +1,102 @@
+import os
+import streamlit as st
+import numpy as np
+
+from whatif import for_residency, with_threshold, with_rate, with_medicare_floor
+
+st.set_page_config(page_title = "Stage 3 Policy Tuning", layout = "centered", page_icon=':money_with_wings:')
+
+RESIDENCIES = {"Resident": 'resident', "Non Resident": 'non_resident', "Holiday Maker": 'holiday_maker'}
+
+# Sorted once per population and residency, then shared by every session
+@st.cache_resource
+def synthetic(taxpayers, seed, residency):
+    from simulate import DEFAULT_POPULATION, draw_incomes
+    incomes = draw_incomes(np.random.default_rng(seed), taxpayers, DEFAULT_POPULATION)
+    return for_residency(incomes, residency)
+
+@st.cache_resource
+def stored(path, residency):
+    # Incomes straight from a memory-mapped result store entry
+    import store
+    table = store.open_entry(path)
+    column = store.read_meta(path)['column']
+    incomes = table[column].to_numpy()
+    return for_residency(incomes[~np.isnan(incomes)], residency)
+
+# Keyed on the upload's id rather than its bytes, which would be hashed again
+# on every slider tick
+@st.cache_resource
+def uploaded(file_id, _data, name, column, residency):
+    import io
+    import pandas as pd
+    if name.lower().endswith(('.parquet', '.pq')):
+        df = pd.read_parquet(io.BytesIO(_data), columns=[column])
+    else:
+        df = pd.read_csv(io.BytesIO(_data), usecols=[column])
+    incomes = pd.to_numeric(df[column], errors='coerce').dropna()
+    return for_residency(incomes.to_numpy(), residency)
+
+def main():
+    st.title("Policy tuning")
+    st.markdown("""
+    Move a threshold or rate of the proposed schedule and see revenue and who is better or worse off
+    against the legislated Stage 3 schedule, over a whole population, as you drag.
+    """)
+
+    with st.sidebar:
+        user_type = st.radio("Residency:", list(RESIDENCIES))
+        residency = RESIDENCIES[user_type]
+        import store
+        saved = {os.path.basename(meta['input']) + f" ({meta['summary']['rows']:,} rows)": path
+                 for path, meta in store.entries()}
+        choice = st.selectbox("Scored population:", ["None"] + list(saved)) if saved else "None"
+        upload = st.file_uploader("Population (CSV or Parquet)", type=['csv', 'parquet'])
+        if choice != "None":
+            whatif, proposed = stored(saved[choice], residency)
+        elif upload is not None:
+            column = st.text_input("Income column:", 'taxable_income')
+            whatif, proposed = uploaded(upload.file_id, upload.getvalue(), upload.name, column, residency)
+        else:
+            taxpayers = st.number_input("Synthetic taxpayers:", 10_000, 20_000_000, 1_000_000, step=100_000)
+            seed = st.number_input("Seed:", 0, value=0)
+            whatif, proposed = synthetic(int(taxpayers), int(seed), residency)
+
+    schedule = proposed.schedule
+    st.subheader("Proposed schedule")
+    for bracket in range(len(schedule.rates)):
+        # Each bracket starts $1 above the (possibly moved) top of the one below
+        lower, upper = proposed.schedule.lowers[bracket], schedule.uppers[bracket]
+        col1, col2 = st.columns(2)
+        with col1:
+            if np.isfinite(upper):
+                following = schedule.uppers[bracket + 1]
+                highest = int(following) - 2 if np.isfinite(following) else int(upper) * 2
+                lowest = min(int(lower) + 1, highest)
+                top = st.slider(f"Top of bracket {bracket + 1}", lowest, highest,
+                                min(max(int(upper), lowest), highest), step=100, key=f"{residency}-top{bracket}")
+                proposed = with_threshold(proposed, bracket, top)
+            else:
+                st.text(f"Above {int(lower) - 1:,}")
+        with col2:
+            rate = st.slider(f"Rate of bracket {bracket + 1} (%)", 0.0, 60.0, schedule.rates[bracket] * 100,
+                             step=0.5, key=f"{residency}-rate{bracket}")
+            proposed = with_rate(proposed, bracket, rate / 100)
+    if proposed.medicare:
+        floor = st.slider("Medicare levy low income threshold", 15_000, 40_000,
+                          int(proposed.medicare.lower_limit), step=100)
+        proposed = with_medicare_floor(proposed, floor)
+
+    outcome = whatif.evaluate(proposed)
+    st.subheader("Outcome")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Current revenue", f"${outcome.current / 1e6:,.1f}m")
+    col2.metric("Proposed revenue", f"${outcome.proposed / 1e6:,.1f}m", f"{outcome.difference / 1e6:,.1f}m")
+    col3.metric("Taxpayers", f"{outcome.taxpayers:,}")
+    col1.metric("Better off", f"{outcome.better_off:,}")
+    col2.metric("Worse off", f"{outcome.worse_off:,}")
+    col3.metric("Unchanged", f"{outcome.unchanged:,}")
+    st.caption(f"Recalculated in {outcome.seconds * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from calc import make_schedule, rule
+from piecewise import fresh_liability, liability
+
+# Live what-if analysis for one residency: a population's incomes are sorted
+# once with a running sum, so the count and income total of any income range
+# are two binary searches away.  Every liability is piecewise linear, so its
+# population total is count * c + m * income summed over its pieces, and the
+# taxpayers better or worse off are those on the right side of the root of
+# the difference on each piece.  Range statistics are cached, so moving one
+# threshold only searches the pieces next to it.  Totals are of the unrounded
+# liability, within a dollar per taxpayer of the whole-dollar net_liability.
+
+Outcome = namedtuple('Outcome', ['taxpayers', 'current', 'proposed', 'difference',
+                                 'better_off', 'worse_off', 'unchanged', 'seconds'])
+
+class IncomeStats:
+    # Sorted incomes with their running sum, for totals of piecewise-linear
+    # functions over the whole population
+
+    # Cached ranges kept before starting over, as every new threshold adds some
+    MAX_STATS = 100_000
+
+    def __init__(self, taxable_income):
+        self.incomes = np.sort(np.asarray(taxable_income, dtype=np.float64))
+        self.running = np.concatenate(([0.0], np.cumsum(self.incomes)))
+        self.stats = {}
+
+    def _positions(self, points, side='left'):
+        return np.searchsorted(self.incomes, points, side=side)
+
+    def range_stats(self, lowers, uppers):
+        # Taxpayers and their income total in each [lower, upper), cached per range
+        keys = list(zip(lowers.tolist(), uppers.tolist()))
+        missing = [key for key in keys if key not in self.stats]
+        if len(self.stats) + len(missing) > self.MAX_STATS:
+            self.stats.clear()
+            missing = keys
+        if missing:
+            lo, hi = np.array(missing).T
+            i, j = self._positions(lo), self._positions(hi)
+            for key, count, income in zip(missing, (j - i).tolist(), (self.running[j] - self.running[i]).tolist()):
+                self.stats[key] = (count, income)
+        counts, incomes = np.array([self.stats[key] for key in keys]).T
+        return counts, incomes
+
+    def total(self, function):
+        counts, incomes = self.range_stats(function.lowers, function.uppers)
+        return float(np.sum(counts * function.c + np.where(counts > 0, function.m * incomes, 0.0)))
+
+    def _count_where(self, function, positive):
+        # Taxpayers where function > 0 (or < 0), piece by piece.  On a sloped
+        # piece that is one side of its root, on a flat piece all or none of it.
+        lowers, uppers, c, m = function.lowers, function.uppers, function.c, function.m
+        sign = 1.0 if positive else -1.0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            root = -c / m
+        rising = sign * m > 0
+        falling = sign * m < 0
+        start = np.where(rising, np.maximum(lowers, root), lowers)
+        stop = np.where(falling, np.minimum(uppers, root), uppers)
+        # Past a root inside the piece the root itself is out, but a piece
+        # starting above its root counts from its own break
+        past_root = rising & (root >= lowers)
+        i = np.where(past_root, self._positions(start, 'right'), self._positions(start))
+        j = self._positions(stop)
+        flat = m == 0
+        count = np.where(flat, np.where(sign * c > 0, j - i, 0), np.maximum(j - i, 0))
+        return int(count.sum())
+
+class WhatIf(IncomeStats):
+    def __init__(self, taxable_income, current):
+        super().__init__(taxable_income)
+        self.current = current
+        self.base = liability(current)
+        self.base_total = self.total(self.base)
+
+    def evaluate(self, proposed):
+        # Revenue and winners and losers for a proposed rules.json entry
+        start = time.perf_counter()
+        function = fresh_liability(proposed)
+        total = self.total(function)
+        gain = self.base - function
+        better_off = self._count_where(gain, True)
+        worse_off = self._count_where(gain, False)
+        taxpayers = len(self.incomes)
+        return Outcome(taxpayers, self.base_total, total, total - self.base_total, better_off, worse_off,
+                       taxpayers - better_off - worse_off, time.perf_counter() - start)
+
+# Parameter changes, each giving a new rule and leaving the one passed in alone
+
+def with_threshold(entry, bracket, value):
+    # Move the top of bracket (and so the start of the next one, $1 above it)
+    schedule = entry.schedule
+    brackets = list(zip(schedule.lowers, schedule.uppers))
+    brackets[bracket] = (brackets[bracket][0], float(value))
+    brackets[bracket + 1] = (float(value) + 1, brackets[bracket + 1][1])
+    return entry._replace(schedule=make_schedule(brackets, schedule.rates))
+
+def with_rate(entry, bracket, value):
+    schedule = entry.schedule
+    rates = list(schedule.rates)
+    rates[bracket] = float(value)
+    return entry._replace(schedule=make_schedule(list(zip(schedule.lowers, schedule.uppers)), rates))
+
+def with_medicare_floor(entry, lower_limit):
+    # The levy is shaded in until 10% of the income over the floor reaches the
+    # full 2%, so the top of the shade-in range moves with it at 1.25 times
+    medicare = entry.medicare
+    return entry._replace(medicare=medicare._replace(lower_limit=float(lower_limit),
+                                                     upper_limit=float(lower_limit) * 1.25))
+
+def for_residency(taxable_income, residency='resident', year='2024-25'):
+    # WhatIf against the legislated rule, plus the proposed rule to start tuning from
+    return WhatIf(taxable_income, rule(year, residency, 'legislated')), rule(year, residency, 'proposed')